@@ -0,0 +1,359 @@
+import ast
+import json
+import os
+import time
+from collections import deque, namedtuple
+import numpy as np
+from curves import CURVE_COLUMNS
+from refdata import CACHE_DIR
+from risk import RISK_COLUMNS
+
+# Alert rules
+#
+# Rules are read from ALERTS_PATH, a JSON list of
+#   {"name": ..., "when": <condition>, "clear": <condition>, "cooldown": <seconds>}
+# where a condition is a Python style expression over the published columns,
+# e.g. "held and bidyield > 7.1" or "Series in ['GS', 'SG'] and
+# volume_delta > 5 * volume_avg". Besides the columns there are
+#   held          the symbol is in the holdings file
+#   prev_<column> the value of a numeric column on the previous snapshot
+#   volume_delta  volume traded since the previous snapshot
+#   volume_avg    average volume_delta of the earlier snapshots since the
+#                 symbol was first seen today, NaN (never true) before there
+#                 is one. It is per snapshot, not per second, so it assumes
+#                 snapshots are published at a steady interval.
+# Conditions are evaluated on the best level row of every symbol.
+#
+# Each condition is parsed once into a numpy expression with its constants
+# lifted out as parameters. Rules that differ only in their constants share
+# one compiled expression, evaluated for all of them at once with the
+# constants as a (rules, 1) column against the (symbols,) columns of the
+# snapshot, so a tick costs a few array operations per distinct rule shape
+# rather than per rule. Symbol and Series are compared as integer codes.
+#
+# A rule fires for a symbol when its condition becomes true and stays quiet
+# until it is cleared: by the clear condition when given (hysteresis, e.g.
+# fire above 7.10 and rearm below 7.08), otherwise as soon as the condition
+# is false. cooldown additionally holds back a refire for that many seconds.
+# Fired alerts are appended to ALERT_LOG_PATH as JSON lines and the most
+# recent ALERT_HISTORY are published with every snapshot.
+ALERTS_PATH = os.environ.get("DEBTVIEW_ALERTS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "alerts.json"))
+ALERT_LOG_PATH = os.environ.get("DEBTVIEW_ALERT_LOG", os.path.join(CACHE_DIR, "alerts.log"))
+ALERT_HISTORY = 200
+NUMERIC_COLUMNS = ["bidyield", "askyield", "avgyield", "bidquantity", "askquantity", "bidprice", "askprice",
+                   "Volume", "VWATP"] + CURVE_COLUMNS + RISK_COLUMNS
+STRING_COLUMNS = ["Symbol", "Series"]
+DERIVED = ["held", "volume_delta", "volume_avg"] + [f"prev_{column}" for column in NUMERIC_COLUMNS]
+NAMES = set(NUMERIC_COLUMNS + STRING_COLUMNS + DERIVED)
+
+Alert = namedtuple('Alert', ['time', 'rule', 'symbol', 'detail'])
+
+COMPARE = {ast.Lt: ast.Lt, ast.LtE: ast.LtE, ast.Gt: ast.Gt, ast.GtE: ast.GtE, ast.Eq: ast.Eq, ast.NotEq: ast.NotEq}
+ARITHMETIC = (ast.Add, ast.Sub, ast.Mult, ast.Div)
+
+
+class RuleCompiler(ast.NodeTransformer):
+    # Rewrites a condition into an array expression: and/or/not become
+    # &/|/~, chained and membership comparisons are expanded, every constant
+    # becomes a parameter name (prefix + position) and string constants are
+    # replaced by their code. Anything else is rejected.
+    def __init__(self, prefix, encode):
+        self.prefix = prefix
+        self.encode = encode
+        self.parameters = []
+        self.names = set()
+
+    def parameter(self, value):
+        self.parameters.append(value)
+        return ast.Name(f"{self.prefix}{len(self.parameters) - 1}", ast.Load())
+
+    def visit_Expression(self, node):
+        return ast.Expression(self.visit(node.body))
+
+    def visit_BoolOp(self, node):
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = ast.BinOp(result, op, value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(ast.Invert(), self.visit(node.operand))
+        if isinstance(node.op, ast.USub):
+            return ast.UnaryOp(ast.USub(), self.visit(node.operand))
+        raise ValueError(f"unsupported operator {type(node.op).__name__}")
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, ARITHMETIC):
+            raise ValueError(f"unsupported operator {type(node.op).__name__}")
+        return ast.BinOp(self.visit(node.left), node.op, self.visit(node.right))
+
+    def visit_Compare(self, node):
+        terms = []
+        left = node.left
+        for op, right in zip(node.ops, node.comparators):
+            string = isinstance(left, ast.Name) and left.id in STRING_COLUMNS
+            if isinstance(op, (ast.In, ast.NotIn)):
+                if not isinstance(right, (ast.List, ast.Tuple)) or not right.elts:
+                    raise ValueError("'in' needs a non-empty list of constants")
+                member = None
+                for element in right.elts:
+                    test = ast.Compare(self.visit(left), [ast.Eq()], [self.constant(element, string)])
+                    member = test if member is None else ast.BinOp(member, ast.BitOr(), test)
+                terms.append(ast.UnaryOp(ast.Invert(), member) if isinstance(op, ast.NotIn) else member)
+            elif type(op) in COMPARE:
+                terms.append(ast.Compare(self.visit(left), [COMPARE[type(op)]()], [self.constant(right, string)]))
+            else:
+                raise ValueError(f"unsupported comparison {type(op).__name__}")
+            left = right
+        result = terms[0]
+        for term in terms[1:]:
+            result = ast.BinOp(result, ast.BitAnd(), term)
+        return result
+
+    def constant(self, node, string):
+        # The right hand side of a comparison; strings only against Symbol and Series
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            if not string:
+                raise ValueError(f"string {node.value!r} compared with a number")
+            return self.parameter(self.encode(node.value))
+        return self.visit(node)
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"unsupported constant {node.value!r}")
+        return self.parameter(float(node.value))
+
+    def visit_Name(self, node):
+        if node.id not in NAMES:
+            raise ValueError(f"unknown name {node.id!r}")
+        self.names.add(node.id)
+        return node
+
+    def generic_visit(self, node):
+        raise ValueError(f"unsupported syntax {type(node).__name__}")
+
+
+def compile_condition(text, prefix, encode):
+    # (shape, parameters, names): shape is the parameterised expression as
+    # a string, equal for conditions that differ only in their constants.
+    # A trial run on one row of zeros catches conditions that are not masks.
+    compiler = RuleCompiler(prefix, encode)
+    shape = ast.unparse(compiler.visit(ast.parse(text, mode='eval')))
+    trial = {name: np.zeros(1) for name in compiler.names}
+    trial.update((f"{prefix}{i}", value) for i, value in enumerate(compiler.parameters))
+    if "held" in trial:
+        trial["held"] = np.zeros(1, dtype=bool)
+    if np.asarray(eval(shape, {"__builtins__": {}}, trial)).dtype != bool:
+        raise ValueError(f"{text!r} is not a true/false condition")
+    return shape, compiler.parameters, compiler.names
+
+
+class RuleGroup:
+    # Rules sharing the same when and clear shapes, evaluated together.
+    # Parameters are (rules, 1) columns, or scalars when every rule of the
+    # group has the same value. The active and fired_at state is
+    # kept as (rules, symbols) in the order of the current best level rows,
+    # and parked by symbol code only when the set of symbols changes.
+    def __init__(self, when, clear, names, capacity):
+        self.when = compile(when, '<alert>', 'eval')
+        self.clear = compile(clear, '<alert>', 'eval') if clear else None
+        self.names = names
+        self.rules = []
+        self.values = []
+        self.parameters = {}
+        self.cooldown = np.empty((0, 1))
+        self.has_cooldown = False
+        self.stored_active = np.zeros((0, capacity), dtype=bool)
+        self.stored_fired_at = np.full((0, capacity), -np.inf)
+        self.active = self.stored_active[:, :0]
+        self.fired_at = self.stored_fired_at[:, :0]
+
+    def add(self, rule, values):
+        self.rules.append(rule)
+        self.values.append(values)
+        columns = np.array(self.values, dtype=float).reshape(len(self.rules), len(self.names))
+        self.parameters = {name: columns[0, i] if (columns[:, i] == columns[0, i]).all() else columns[:, [i]]
+                           for i, name in enumerate(self.names)}
+        self.cooldown = np.array([rule.get("cooldown", 0) for rule in self.rules], dtype=float)[:, None]
+        self.has_cooldown = bool(self.cooldown.any())
+        self.stored_active = np.zeros((len(self.rules), self.stored_active.shape[1]), dtype=bool)
+        self.stored_fired_at = np.full((len(self.rules), self.stored_fired_at.shape[1]), -np.inf)
+        self.active = self.stored_active[:, :0]
+        self.fired_at = self.stored_fired_at[:, :0]
+
+    def grow(self, capacity):
+        extra = capacity - self.stored_active.shape[1]
+        self.stored_active = np.pad(self.stored_active, ((0, 0), (0, extra)))
+        self.stored_fired_at = np.pad(self.stored_fired_at, ((0, 0), (0, extra)), constant_values=-np.inf)
+
+    def realign(self, old_codes, new_codes):
+        self.stored_active[:, old_codes] = self.active
+        self.stored_fired_at[:, old_codes] = self.fired_at
+        self.active = self.stored_active[:, new_codes]
+        self.fired_at = self.stored_fired_at[:, new_codes]
+
+    def evaluate(self, namespace, now):
+        # (rule, position) index arrays of the rules that fire, or None
+        shape = self.active.shape
+        namespace.update(self.parameters)
+        condition = eval(self.when, {"__builtins__": {}}, namespace)
+        if np.shape(condition) != shape:
+            condition = np.broadcast_to(condition, shape)
+        fire = condition & ~self.active
+        if self.has_cooldown:
+            fire &= now - self.fired_at >= self.cooldown
+        if self.clear is not None:
+            self.active = (self.active & ~eval(self.clear, {"__builtins__": {}}, namespace)) | fire
+        elif self.has_cooldown:
+            self.active = (self.active & condition) | fire
+        else:
+            self.active = condition
+        if not fire.any():
+            return None
+        self.fired_at = np.where(fire, now, self.fired_at)
+        return np.nonzero(fire)
+
+
+def load_rules(path=ALERTS_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        print(f"No alert rules at {path}")
+        return []
+
+
+class AlertEngine:
+    # Evaluates the compiled rules on each published snapshot. Symbols,
+    # series and rule string constants share one code table so that string
+    # comparisons are integer comparisons; per symbol state (previous values,
+    # volume baseline, active rules) is indexed by symbol code. update()
+    # returns the alerts fired on this snapshot; recent keeps the last
+    # ALERT_HISTORY of them. log_path None disables the log file.
+    def __init__(self, rules, holdings=None, log_path=ALERT_LOG_PATH, history=ALERT_HISTORY):
+        self.log_path = log_path
+        self.recent = deque(maxlen=history)
+        self.codes = {}
+        self.capacity = 64
+        self.held = np.zeros(self.capacity, dtype=bool)
+        self.previous = {}
+        self.base_volume = np.full(self.capacity, np.nan)
+        self.seen = np.zeros(self.capacity)
+        self.groups = []
+        self.names = set()
+        self.symbols = None
+        self.rows = None
+
+        groups = {}
+        for rule in rules:
+            try:
+                when, when_parameters, names = compile_condition(rule["when"], "_w", self.encode)
+                clear, clear_parameters, clear_names = compile_condition(rule["clear"], "_c", self.encode) if rule.get("clear") else (None, [], set())
+            except (KeyError, SyntaxError, TypeError, ValueError) as e:
+                print(f"Skipping alert rule {rule.get('name')!r}: {e}")
+                continue
+            names |= clear_names
+            key = (when, clear)
+            if key not in groups:
+                parameters = [f"_w{i}" for i in range(len(when_parameters))] + [f"_c{i}" for i in range(len(clear_parameters))]
+                groups[key] = RuleGroup(when, clear, parameters, self.capacity)
+                self.groups.append(groups[key])
+            groups[key].add(dict(rule, names=sorted(names - set(STRING_COLUMNS) - {"held"})), when_parameters + clear_parameters)
+            self.names |= names
+
+        if holdings is not None:
+            for symbol in holdings.index:
+                self.held[self.encode(str(symbol))] = True
+        tracked = {name[len("prev_"):] for name in self.names if name.startswith("prev_")}
+        if self.names & {"volume_delta", "volume_avg"}:
+            tracked.add("Volume")
+        self.previous = {column: np.full(self.capacity, np.nan) for column in tracked}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.codes)
+            if code >= self.capacity:
+                self._grow(2 * self.capacity)
+        return code
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.capacity = capacity
+        self.held = np.pad(self.held, (0, extra))
+        self.previous = {column: np.pad(values, (0, extra), constant_values=np.nan) for column, values in self.previous.items()}
+        self.base_volume = np.pad(self.base_volume, (0, extra), constant_values=np.nan)
+        self.seen = np.pad(self.seen, (0, extra))
+        for group in self.groups:
+            group.grow(capacity)
+
+    def _rows(self, data):
+        # Best level positions with their symbols and symbol and series
+        # codes, reused while the symbol column is unchanged
+        symbols = data["Symbol"]
+        if self.symbols is None or not symbols.equals(self.symbols):
+            first = np.flatnonzero(~symbols.duplicated().to_numpy())
+            best = symbols.to_numpy()[first]
+            codes = np.array([self.encode(symbol) for symbol in best], dtype=np.intp)
+            series = np.array([self.encode(str(value)) for value in data["Series"].to_numpy()[first]], dtype=np.intp)
+            old_codes = self.rows[2] if self.rows is not None else codes[:0]
+            for group in self.groups:
+                group.realign(old_codes, codes)
+            self.rows = (first, best, codes, series)
+            self.symbols = symbols
+        return self.rows
+
+    def update(self, data, now=None):
+        now = time.time() if now is None else now
+        if not self.groups or data.empty:
+            return []
+        first, symbols, codes, series = self._rows(data)
+        columns = {column: data[column].to_numpy(dtype=float)[first]
+                   for column in (self.names & set(NUMERIC_COLUMNS)) | set(self.previous)}
+        namespace = {"Symbol": codes, "Series": series, "held": self.held[codes], **columns}
+        for column, values in self.previous.items():
+            namespace[f"prev_{column}"] = values[codes]
+        if "Volume" in self.previous:
+            volume = columns["Volume"]
+            previous = namespace["prev_Volume"]
+            # A first sighting or a drop (new session) restarts the average.
+            # seen counts the snapshots since then, so up to the previous
+            # one there are seen - 1 deltas summing to previous - base; the
+            # current delta stays out of its own baseline.
+            restart = np.isnan(previous) | (volume < previous)
+            self.base_volume[codes[restart]] = volume[restart]
+            self.seen[codes[restart]] = 0
+            seen = self.seen[codes]
+            namespace["volume_delta"] = np.where(restart, 0.0, volume - previous)
+            namespace["volume_avg"] = np.where(seen > 1, (previous - self.base_volume[codes]) / np.maximum(seen - 1, 1), np.nan)
+            self.seen[codes] = seen + 1
+
+        fired = []
+        for group in self.groups:
+            hits = group.evaluate(namespace, now)
+            if hits is not None:
+                for rule, position in zip(*hits):
+                    rule = group.rules[rule]
+                    detail = ", ".join(f"{name} {namespace[name][position]:g}" for name in rule["names"])
+                    fired.append(Alert(now, rule["name"], symbols[position], detail))
+
+        for column, values in self.previous.items():
+            values[codes] = columns[column]
+        if fired:
+            self.recent.extend(fired)
+            self.log(fired)
+        return fired
+
+    def log(self, alerts):
+        if not self.log_path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.log_path), exist_ok=True)
+            with open(self.log_path, 'a') as f:
+                for alert in alerts:
+                    f.write(json.dumps(alert._asdict(), default=str) + "\n")
+        except OSError as e:
+            print(f"Writing alert log failed: {e}")
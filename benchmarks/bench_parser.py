@@ -0,0 +1,92 @@
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+import brotli
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from feed import DepthParser, decode_body
+
+# Parse time and peak allocation of the liveBonds payload parser against the
+# dict flattening fetch_update used before. Pass recorded response bodies
+# (as saved by the recorder) or let it synthesise a payload.
+
+
+def legacy_parse(content):
+    data = json.loads(decode_body(content))
+    extracted_data = []
+    for entry in data['data']:
+        for i in range(1, 6):
+            extracted_data.append([
+                {
+                    'Symbol': entry['symbol'],
+                    'Series': entry['series'],
+                    'ISIN': entry['isinCode'],
+                    'bidprice': entry[f'buyPrice{i}'],
+                    'bidquantity': entry[f'buyQuantity{i}'],
+                    'askprice': entry[f'sellPrice{i}'],
+                    'askquantity': entry[f'sellQuantity{i}'],
+                    'Volume': entry['totalTradedVolume'],
+                    'VWATP': entry['averagePrice']
+                }
+            ])
+    flattened_data = []
+    for entry_list in extracted_data:
+        for entry_dict in entry_list:
+            flattened_data.append(entry_dict)
+    return pd.DataFrame(flattened_data)
+
+
+def synthetic_payload(bonds):
+    entries = []
+    for b in range(bonds):
+        entry = {'symbol': f'{700 + b % 100}GS{2030 + b // 100}', 'series': 'GS', 'isinCode': f'IN00{b:08d}',
+                 'totalTradedVolume': 1000 * b, 'averagePrice': 100 + b % 7 / 10}
+        for i in range(1, 6):
+            entry[f'buyPrice{i}'] = 99.5 - i / 100
+            entry[f'buyQuantity{i}'] = 10 * i
+            entry[f'sellPrice{i}'] = 100.5 + i / 100
+            entry[f'sellQuantity{i}'] = 5 * i
+        entries.append(entry)
+    return brotli.compress(json.dumps({'data': entries}).encode('utf-8'))
+
+
+def measure(parse, payloads, repeat):
+    # Timed without tracemalloc, which slows allocation heavy code a lot
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            parse(payload)
+    elapsed = (time.perf_counter() - started) / (repeat * len(payloads))
+    tracemalloc.start()
+    for payload in payloads:
+        parse(payload)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the liveBonds payload parser')
+    parser.add_argument('payloads', nargs='*', help='recorded liveBonds response bodies')
+    parser.add_argument('--bonds', type=int, default=400, help='bonds in the synthetic payload')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.payloads:
+        payloads = [open(path, 'rb').read() for path in args.payloads]
+    else:
+        payloads = [synthetic_payload(args.bonds)]
+
+    depth_parser = DepthParser()
+    pd.testing.assert_frame_equal(legacy_parse(payloads[0]), depth_parser.parse(payloads[0]).astype({'Symbol': str}), check_dtype=False)
+    for name, parse in (('legacy', legacy_parse), ('columnar', depth_parser.parse)):
+        elapsed, peak = measure(parse, payloads, args.repeat)
+        print(f'{name:>9}: {elapsed * 1000:8.2f} ms/payload  peak {peak / 1024:8.0f} KiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import StringIO
+import brotli
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bondmath import settlement_date_for
+from feed import DepthParser, decode_body, load_entries
+from metrics import Metrics
+from pipeline import IncrementalPricer, final_yields, price_depth
+from refdata import DEBT_URL, build_master_debt
+from replay import Recorder, ReplayFetcher, load_recording, replay
+
+# End to end pipeline benchmark: replays a recording (made with
+# DEBTVIEW_RECORD_DIR) or a synthetic session through fetch, decode, parse,
+# price, publish, page views and charts, and reports per stage latency
+# percentiles, throughput and peak memory. --scale replicates every bond of
+# the recording under suffixed symbols to see how the pipeline grows.
+
+LIVE_URL = "https://www.nseindia.com/api/liveBonds-traded-on-cm?type=gsec"
+STAGES = ['fetch', 'decode', 'parse', 'price', 'risk', 'curves', 'alerts', 'views', 'charts', 'tick']
+
+
+def synthetic_recording(directory, bonds, ticks, interval=5, seed=0):
+    rng = np.random.default_rng(seed)
+    series = np.where(np.arange(bonds) % 7 == 0, 'TB', np.where(np.arange(bonds) % 3 == 0, 'SG', 'GS'))
+    symbols = [f'{700 + b % 100}{s}{2030 + b // 100}' for b, s in enumerate(series)]
+    coupons = np.where(series == 'TB', 0, np.round(rng.uniform(6, 8, bonds), 2))
+    redemption = pd.Series(np.datetime64('2027-01-01') + rng.integers(0, 365 * 35, bonds)).dt.strftime('%d-%b-%Y')
+    debt_csv = pd.DataFrame({'SYMBOL': symbols, ' IP RATE': coupons, ' REDEMPTION DATE': redemption}).to_csv(index=False)
+
+    recorder = Recorder(directory)
+    start = time.time()
+    recorder.save(DEBT_URL, debt_csv.encode('utf-8'), ts=start)
+    mid = np.where(series == 'TB', 97.0, 100.0) + rng.normal(0, 1, bonds)
+    volume = np.zeros(bonds, dtype=np.int64)
+    for tick in range(ticks):
+        # About a tenth of the book moves every poll
+        moved = rng.random(bonds) < 0.1
+        mid[moved] += rng.normal(0, 0.05, moved.sum())
+        volume[moved] += rng.integers(1, 50, moved.sum()) * 100
+        entries = []
+        for b in range(bonds):
+            entry = {'symbol': symbols[b], 'series': series[b], 'isinCode': f'IN00{b:08d}',
+                     'totalTradedVolume': int(volume[b]), 'averagePrice': round(float(mid[b]), 4)}
+            for i in range(1, 6):
+                entry[f'buyPrice{i}'] = round(float(mid[b]) - 0.05 * i, 4)
+                entry[f'buyQuantity{i}'] = 10 * i
+                entry[f'sellPrice{i}'] = round(float(mid[b]) + 0.05 * i, 4)
+                entry[f'sellQuantity{i}'] = 5 * i
+            entries.append(entry)
+        recorder.save(LIVE_URL, brotli.compress(json.dumps({'data': entries}).encode('utf-8')), ts=start + 1 + tick * interval)
+
+
+def scaled(records, scale):
+    # Every bond repeated scale times, the copies suffixed _1, _2, ...
+    if scale == 1:
+        return records
+    out = []
+    for record in records:
+        if record.url == DEBT_URL:
+            debt = pd.read_csv(StringIO(decode_body(record.content)), index_col=False)
+            copies = [debt] + [debt.assign(SYMBOL=debt['SYMBOL'].astype(str) + f'_{k}') for k in range(1, scale)]
+            content = pd.concat(copies).to_csv(index=False).encode('utf-8')
+        else:
+            entries = json.loads(decode_body(record.content))['data']
+            entries = entries + [dict(entry, symbol=f"{entry['symbol']}_{k}") for k in range(1, scale) for entry in entries]
+            content = brotli.compress(json.dumps({'data': entries}).encode('utf-8'))
+        out.append(record._replace(content=content))
+    return out
+
+
+def pricing_comparison(records):
+    # Per poll cost of the incremental pricer against repricing the whole
+    # book, and of a quiet poll (the same payload again)
+    fetcher = ReplayFetcher(records)
+    settlement = settlement_date_for(datetime.fromtimestamp(fetcher.ticks[0][0])).strftime('%Y-%m-%d')
+    master_debt = build_master_debt(decode_body(fetcher.master), settlement)
+    parser = DepthParser()
+    pricer = IncrementalPricer()
+    timings = {'incremental': [], 'quiet': [], 'full': []}
+    changed = []
+    for _, bodies in fetcher.ticks:
+        bid_ask = pd.concat([parser.parse_entries(load_entries(body)) for body in bodies.values()], ignore_index=True)
+        for name, price in (('incremental', lambda: pricer.update(bid_ask, master_debt)),
+                            ('quiet', lambda: pricer.update(bid_ask, master_debt)),
+                            ('full', lambda: final_yields(price_depth(bid_ask, master_debt)))):
+            started = time.perf_counter()
+            price()
+            timings[name].append(time.perf_counter() - started)
+            if name == 'incremental':
+                changed.append(len(pricer.changed))
+    # The first poll prices everything and is left out
+    print(f"pricing, median of {len(changed) - 1} polls with {np.median(changed[1:]):.0f} of {len(pricer.layout['unique'])} symbols changed")
+    for name, values in timings.items():
+        print(f"{name:>12} {np.median(values[1:]) * 1000:9.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the ingest to render pipeline on a recorded session')
+    parser.add_argument('recording', nargs='?', help='recording directory; synthesised when omitted')
+    parser.add_argument('--bonds', type=int, default=400, help='bonds in the synthetic session')
+    parser.add_argument('--ticks', type=int, default=30, help='polls in the synthetic session')
+    parser.add_argument('--scale', type=int, default=1, help='replicate the universe this many times')
+    parser.add_argument('--speed', type=float, default=None, help='1 for real time; default is as fast as possible')
+    parser.add_argument('--no-render', action='store_true', help='skip page views and charts')
+    parser.add_argument('--tracemalloc', action='store_true', help='also report peak Python allocations (slow)')
+    parser.add_argument('--no-pricing', action='store_true', help='skip the incremental against full reprice comparison')
+    args = parser.parse_args()
+
+    if args.recording:
+        records = load_recording(args.recording)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            synthetic_recording(directory, args.bonds, args.ticks)
+            records = load_recording(directory)
+    records = scaled(records, args.scale)
+
+    metrics = Metrics(size=None)
+    if args.tracemalloc:
+        tracemalloc.start()
+    started = time.perf_counter()
+    service = replay(records, speed=args.speed, render=not args.no_render, metrics=metrics)
+    elapsed = time.perf_counter() - started
+    peak_traced = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+    ticks = len(metrics.samples.get('tick', ()))
+    print(f"{ticks} ticks, {len(service.bus.latest().data)} rows in {elapsed:.2f} s ({ticks / elapsed:.1f} ticks/s)")
+    print(f"{'stage':>8} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9}")
+    for stage in STAGES:
+        if stage in metrics.samples:
+            p = metrics.percentiles(stage)
+            print(f"{stage:>8} {p[50] * 1000:9.2f} {p[90] * 1000:9.2f} {p[99] * 1000:9.2f}")
+    # ru_maxrss is KiB on Linux
+    print(f"peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MiB")
+    if peak_traced is not None:
+        print(f"peak traced {peak_traced / 1024 / 1024:.0f} MiB")
+    if not args.no_pricing:
+        pricing_comparison(records)
+
+
+if __name__ == '__main__':
+    main()
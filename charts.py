@@ -0,0 +1,385 @@
+import math
+import threading
+from io import BytesIO
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg, RendererAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.figure import Figure
+from matplotlib.layout_engine import TightLayoutEngine
+from matplotlib.path import Path
+from matplotlib.text import Text
+from matplotlib.ticker import MaxNLocator
+from matplotlib.transforms import Affine2D, Bbox
+from PIL import Image
+
+# Market Statistics charts
+#
+# One figure lives for the whole process. Each snapshot updates the data of
+# the existing artists (marker lines, curves, bar heights) and renders the
+# figure to a PNG once; sessions reuse that image until the version moves.
+# The figure is not registered with pyplot, so nothing accumulates.
+# Yield panels draw the fitted NSS and spline curves of the snapshot and hide
+# the points those curves rejected as outliers.
+#
+# Laying out text (ticks, titles, legends) is most of the cost of a draw, so
+# the data artists are animated: the rest of the figure is drawn once into a
+# cached background and each snapshot only blits the data over it. Bar labels
+# are stamped from images of their text, rendered once per string. A panel
+# whose view changed is redrawn into the background on its own, so views
+# move in steps: yield views snap to tick values with room around the data,
+# volume views double when the bars outgrow them and the bar slots grow by
+# half. The whole figure is drawn again only when the visible panels change
+# or the volume symbols need more room, which recomputes the layout.
+# The PNG is palette based, which PIL writes without its adaptive row
+# filters; those cost more than drawing the chart.
+CURVE_STYLES = [('nss', 'NSS', '-'), ('spline', 'Spline', '--')]
+# The columns the charts read
+CHART_COLUMNS = ['Symbol', 'Series', 'next coupon date', 'nper', 'Volume', 'avgyield',
+                 'bidyield', 'askyield', 'bidquantity', 'askquantity']
+
+
+def png_bytes(image, palette):
+    # PNG of an RGB image mapped onto the colours of palette, a P mode image
+    buffer = BytesIO()
+    image.quantize(palette=palette, dither=Image.Dither.NONE).save(buffer, format='png', compress_level=1)
+    return buffer.getvalue()
+
+
+def order_book(data, series):
+    return data[(data['Series'] == series) & (data["next coupon date"] != "DNE")]
+
+
+def traded(book):
+    # One row per traded symbol of an order book
+    return book[book["Volume"] != 0].groupby('Symbol').first().reset_index()
+
+
+def nice_limits(low, high):
+    # The tick values enclosing low..high
+    ticks = MaxNLocator(nbins=5).tick_values(low, high)
+    return ticks[0], ticks[-1]
+
+
+def settle(limits, low, high, room=0.25, floor=-np.inf):
+    # limits while low..high sits inside them and spans a third of them,
+    # else tick-aligned limits leaving room times the span on either side,
+    # but not below floor
+    if limits[0] <= low and high <= limits[1] and 3 * (high - low) >= limits[1] - limits[0]:
+        return limits
+    pad = max(high - low, abs(high) * 0.01, 1e-9) * room
+    return nice_limits(max(low - pad, floor), high + pad)
+
+
+def fit_view(ax, x, y):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return
+    x, y = x[finite], y[finite]
+    # x is years to maturity
+    xlim = settle(ax.get_xlim(), x.min(), x.max(), floor=0)
+    ylim = settle(ax.get_ylim(), y.min(), y.max())
+    if xlim != ax.get_xlim():
+        ax.set_xlim(xlim)
+    if ylim != ax.get_ylim():
+        ax.set_ylim(ylim)
+
+
+def near_curve(curve, maturities, yields):
+    # Points within the curve's outlier cutoff; without a curve, every
+    # point with a yield
+    maturities = np.asarray(maturities, dtype=float)
+    yields = np.asarray(yields, dtype=float)
+    if curve is None:
+        return np.isfinite(yields) & (yields > 0)
+    return np.abs(yields - curve(maturities)) <= curve.cutoff
+
+
+class TextStamps:
+    # Texts rendered once per string into RGBA images and blended in place
+    # wherever they are needed; laying out and rasterizing a string costs
+    # far more than blending its pixels. props are Text properties.
+    def __init__(self, figure, **props):
+        self.text = Text(0, 0, '', **props)
+        self.text.set_figure(figure)
+        # string -> (rows bottom up as draw_image takes them, offset of the
+        # bottom left corner from the anchor)
+        self.images = {}
+
+    def image(self, string):
+        image = self.images.get(string)
+        if image is None:
+            figure = self.text.get_figure()
+            self.text.set_text(string)
+            bbox = self.text.get_window_extent(figure.canvas.get_renderer())
+            renderer = RendererAgg(math.ceil(bbox.width) + 2, math.ceil(bbox.height) + 2, figure.dpi)
+            self.text.set_position((1 - bbox.x0, 1 - bbox.y0))
+            self.text.draw(renderer)
+            self.text.set_position((0, 0))
+            image = (np.asarray(renderer.buffer_rgba())[::-1].copy(), (bbox.x0 - 1, bbox.y0 - 1))
+            self.images[string] = image
+        return image
+
+    def draw(self, renderer, strings, anchors):
+        # Draws each string at its anchor, in pixels, and forgets the images
+        # of strings not drawn
+        images = {}
+        gc = renderer.new_gc()
+        for string, (x, y) in zip(strings, anchors):
+            pixels, (left, bottom) = images[string] = self.image(string)
+            renderer.draw_image(gc, round(x + left), round(y + bottom), pixels)
+        gc.restore()
+        self.images = images
+
+
+class VolumeBars:
+    # Symbols are stamped under the bars rather than set as tick labels, and
+    # volumes above them, so neither a change in the ranking nor in the
+    # volumes needs a full draw.
+    def __init__(self, ax, color, label_color):
+        self.ax = ax
+        self.symbols = []
+        self.volumes = np.empty(0)
+        # All bars of the panel as one artist
+        self.bars = ax.add_collection(PolyCollection([], facecolors=color, animated=True), autolim=False)
+        self.symbol_stamps = TextStamps(ax.figure, ha='center', va='top', rotation=90, fontsize=10)
+        self.value_stamps = TextStamps(ax.figure, ha='center', va='bottom', rotation='vertical', fontsize=10,
+                                       color=label_color)
+        # Views set by hand, never autoscaled
+        ax.set_xticks([])
+        ax.set_xlim(-0.5, 0.5)
+        ax.set_ylim(0, 1)
+
+    def update(self, symbols, volumes):
+        # Returns True when the symbols need more room below the axes than
+        # the layout gave them
+        symbols = list(symbols)
+        volumes = np.asarray(volumes, dtype=float)
+        relayout = False
+        if symbols != self.symbols and symbols:
+            # The axis label goes below the symbols, which it cannot see
+            tallest = max(self.symbol_stamps.image(symbol)[0].shape[0] for symbol in symbols)
+            labelpad = 11 + tallest * 72 / self.ax.figure.dpi
+            if labelpad > self.ax.xaxis.labelpad:
+                self.ax.xaxis.labelpad = labelpad
+                relayout = True
+        self.symbols = symbols
+        self.volumes = volumes
+        # Corners of bars 0.8 wide centred on 0, 1, 2, ...
+        corners = np.zeros((len(volumes), 4, 2))
+        corners[:, :, 0] = np.arange(len(volumes))[:, None] + [-0.4, -0.4, 0.4, 0.4]
+        corners[:, 1:3, 1] = volumes[:, None]
+        self.bars.set_verts(corners)
+        # Slots grow by half and volumes double, so the view changes rarely
+        slots = round(self.ax.get_xlim()[1] + 0.5)
+        if not len(symbols) <= slots <= 3 * max(len(symbols), 1):
+            self.ax.set_xlim(-0.5, max(len(symbols) * 3 // 2, 1) - 0.5)
+        if len(volumes):
+            top = self.ax.get_ylim()[1]
+            peak = float(np.max(volumes))
+            if not peak <= top <= 8 * max(peak, 1):
+                self.ax.set_ylim(0, nice_limits(0, 2 * peak)[1])
+        return relayout
+
+    def draw_labels(self, renderer):
+        # Symbols 7 points under the axes, volumes just above their bars
+        if not self.symbols:
+            return
+        x = np.arange(len(self.symbols))
+        tops = self.ax.transData.transform(np.column_stack([x, self.volumes * 1.02]))
+        below = self.ax.bbox.y0 - 7 * self.ax.figure.dpi / 72
+        self.symbol_stamps.draw(renderer, self.symbols, [(left, below) for left, _ in tops])
+        self.value_stamps.draw(renderer, [str(int(volume)) for volume in self.volumes], tops)
+
+
+class MarketCharts:
+    def __init__(self, dpi=80):
+        self.dpi = dpi
+        self.lock = threading.Lock()
+        self.version = None
+        self.image = None
+        self.figure = Figure(figsize=(16, 18), dpi=dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        # Applied when the volume symbols need more room; Figure.tight_layout()
+        # would leave an engine behind that lays the figure out on every draw
+        self.layout = TightLayoutEngine()
+        # Background without the data, the views it was drawn for, the
+        # region each axes drew in, the legend pixels put back over the data
+        # and the PNG palette
+        self.background = None
+        self.drawn_for = None
+        self.regions = {}
+        self.legends = {}
+        self.palette = None
+        axs = self.figure.subplots(nrows=3, ncols=2)
+        self.axes = list(axs.flat)
+
+        def yield_axes(ax, title, markers):
+            lines = [ax.plot([], [], linestyle='none', marker=marker, color=color, label=label, animated=True)[0]
+                     for label, marker, color in markers]
+            # One line per marker set and curve model, keyed by model
+            for line in lines:
+                line.curves = {model: ax.plot([], [], linestyle=style, color=line.get_color(), linewidth=1,
+                                              label=f'{line.get_label()} {name}', animated=True)[0]
+                               for model, name, style in CURVE_STYLES}
+            ax.set_title(title, fontsize=14)
+            ax.set_xlabel('Years to Maturity', fontsize=12)
+            ax.set_ylabel('Yield', fontsize=12)
+            ax.legend()
+            ax.grid(True)
+            return lines
+
+        def volume_axes(ax, title, color, label_color):
+            ax.set_title(title, fontsize=14)
+            ax.set_xlabel('Symbol', fontsize=12)
+            ax.set_ylabel('Volume', fontsize=12)
+            return VolumeBars(ax, color, label_color)
+
+        self.gs_traded, = yield_axes(axs[0, 0], 'Yield Curve for GS (Traded)', [('Avg Yield', 'x', 'red')])
+        self.sg_traded, = yield_axes(axs[0, 1], 'Yield Curve for SG (Traded)', [('Avg Yield', 'o', 'blue')])
+        self.gs_volume = volume_axes(axs[1, 0], 'Volume Traded for GS', 'blue', 'red')
+        self.sg_volume = volume_axes(axs[1, 1], 'Volume Traded for SG', 'green', 'green')
+        self.gs_book = yield_axes(axs[2, 0], 'Yield Curve for GS (Order Book)', [('Bid Yield', 'o', 'blue'), ('Ask Yield', 'x', 'red')])
+        self.sg_book = yield_axes(axs[2, 1], 'Yield Curve for SG (Order Book)', [('Bid Yield', 'o', 'blue'), ('Ask Yield', 'x', 'red')])
+        self.layout.execute(self.figure)
+
+    @staticmethod
+    def _set_points(line, x, y):
+        line.set_data(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+
+    @staticmethod
+    def _fit(ax):
+        lines = [line for line in ax.lines if len(line.get_xdata())]
+        if lines:
+            fit_view(ax, np.concatenate([line.get_xdata() for line in lines]),
+                     np.concatenate([line.get_ydata() for line in lines]))
+
+    @staticmethod
+    def _set_curves(line, curves, series, side, maturities):
+        maturities = np.asarray(maturities, dtype=float)
+        grid = np.linspace(maturities.min(), maturities.max(), 100) if maturities.size else np.empty(0)
+        for model, curve_line in line.curves.items():
+            curve = curves.get((series, side, model))
+            if curve is None or not grid.size:
+                curve_line.set_data([], [])
+            else:
+                curve_line.set_data(grid, curve(grid))
+
+    def _set_yields(self, line, curves, series, side, frame, column):
+        curve = curves.get((series, side, 'nss')) or curves.get((series, side, 'spline'))
+        kept = frame[near_curve(curve, frame['nper'], frame[column])]
+        self._set_curves(line, curves, series, side, kept['nper'])
+        self._set_points(line, kept['nper'], kept[column])
+
+    def update(self, data, curves=None):
+        curves = curves or {}
+        data = data[CHART_COLUMNS]
+        relayout = False
+        for series, traded_line, volume_bars, (bid_line, ask_line) in (
+                ('GS', self.gs_traded, self.gs_volume, self.gs_book),
+                ('SG', self.sg_traded, self.sg_volume, self.sg_book)):
+            book = order_book(data, series)
+            data_traded = traded(book)
+            self._set_yields(traded_line, curves, series, 'traded', data_traded, 'avgyield')
+            self._fit(traded_line.axes)
+            traded_line.axes.set_visible(not data_traded.empty)
+
+            by_volume = data_traded.sort_values(by='Volume', ascending=False)
+            relayout |= volume_bars.update(by_volume['Symbol'], by_volume['Volume'].to_numpy())
+            volume_bars.ax.set_visible(not data_traded.empty)
+
+            self._set_yields(bid_line, curves, series, 'bid', book[book['bidquantity'] != 0], 'bidyield')
+            self._set_yields(ask_line, curves, series, 'ask', book[book['askquantity'] != 0], 'askyield')
+            self._fit(bid_line.axes)
+            bid_line.axes.set_visible(not book.empty)
+        if relayout:
+            self.layout.execute(self.figure)
+
+    def _views(self):
+        return [(ax.get_visible(), ax.get_position().bounds, ax.viewLim.bounds) for ax in self.axes]
+
+    def _clear(self, bbox):
+        # Paints bbox, in pixels, with the figure colour
+        renderer = self.canvas.get_renderer()
+        x0, y0 = np.floor(bbox.p0) - 1
+        x1, y1 = np.ceil(bbox.p1) + 1
+        gc = renderer.new_gc()
+        gc.set_linewidth(0)
+        gc.set_antialiased(False)
+        renderer.draw_path(gc, Path.unit_rectangle(), Affine2D().scale(x1 - x0, y1 - y0).translate(x0, y0),
+                           self.figure.get_facecolor())
+        gc.restore()
+
+    def _draw_background(self):
+        # Draws everything but the data: the whole figure when the layout or
+        # the visible panels changed, else only the panels whose view changed
+        views = self._views()
+        if views == self.drawn_for:
+            return
+        renderer = self.canvas.get_renderer()
+        if self.drawn_for is None or [view[:2] for view in views] != [view[:2] for view in self.drawn_for]:
+            self.canvas.draw()
+            self.regions = {}
+            # New panels may bring colours the palette lacks
+            self.palette = None
+            redrawn = self.axes
+        else:
+            self.canvas.restore_region(self.background)
+            redrawn = [ax for ax, view, drawn in zip(self.axes, views, self.drawn_for) if view != drawn]
+            for ax in redrawn:
+                if ax in self.regions:
+                    self._clear(self.regions[ax])
+                ax.draw(renderer)
+        for ax in redrawn:
+            if ax.get_visible():
+                # Kept with the old region, so the next clear covers both
+                region = ax.get_tightbbox(renderer)
+                self.regions[ax] = Bbox.union([region, self.regions[ax]]) if ax in self.regions else region
+                if ax.get_legend() is not None:
+                    self.legends[ax] = self.canvas.copy_from_bbox(ax.get_legend().get_window_extent(renderer))
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self.drawn_for = self._views()
+
+    def _draw(self):
+        # The background, then the data and bar labels of the visible panels
+        # with their legends back on top
+        self._draw_background()
+        self.canvas.restore_region(self.background)
+        visible = [ax for ax in self.axes if ax.get_visible()]
+        for ax in visible:
+            for artist in ax.get_children():
+                if artist.get_animated():
+                    ax.draw_artist(artist)
+        renderer = self.canvas.get_renderer()
+        for bars in (self.gs_volume, self.sg_volume):
+            if bars.ax.get_visible():
+                bars.draw_labels(renderer)
+        for ax in visible:
+            if ax in self.legends:
+                self.canvas.restore_region(self.legends[ax])
+
+    def render(self, snapshot):
+        # PNG for the snapshot, drawn at most once per version
+        with self.lock:
+            if self.version != snapshot.version:
+                self.update(snapshot.data, snapshot.curves)
+                self._draw()
+                image = Image.frombuffer('RGBA', self.canvas.get_width_height(), self.canvas.buffer_rgba(),
+                                         'raw', 'RGBA', 0, 1).convert('RGB')
+                if self.palette is None:
+                    # The colours of the chart, taken again after each full draw
+                    self.palette = image.quantize(256, method=Image.Quantize.FASTOCTREE)
+                self.image = png_bytes(image, self.palette)
+                self.version = snapshot.version
+            return self.image
+
+    def close(self):
+        with self.lock:
+            self.figure.clear()
+            self.image = None
+            self.background = None
+            self.drawn_for = None
+            self.regions = {}
+            self.legends = {}
+            self.palette = None
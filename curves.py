@@ -0,0 +1,287 @@
+import numpy as np
+
+# Yield curve fitting
+#
+# Every snapshot, Nelson-Siegel-Svensson and a penalised cubic spline are
+# fitted separately to the GS and SG traded (VWAP) yields and to the best
+# bid and best ask yields of the order book, against years to maturity.
+#
+# NSS is linear in its four betas once the two decay times are fixed, so the
+# betas come from a weighted least squares solve and only the decay times
+# are searched: a coarse grid on the first fit, then a shrinking pattern
+# search around the previous tick's decay times. With six parameters NSS
+# would run through a handful of points exactly and swing wildly between
+# them, so it needs NSS_MIN_POINTS points; down to NS_MIN_POINTS the second
+# hump is dropped (plain Nelson-Siegel, beta3 = 0), and below that there is
+# no NSS curve and the tables use the spline. Decay times stay within
+# TAU_BOUNDS years, and a fit is only accepted with a positive long rate
+# (beta0) and short rate (beta0 + beta1) and with the curve staying within
+# PLAUSIBLE_BAND of the observed yields over the fitted maturities. The spline is a P-spline
+# (uniform cubic B-splines in log maturity with a second difference
+# penalty); its smoothing weight is chosen by GCV over a grid, then only
+# among neighbours of the previous weight.
+#
+# Outliers are rejected by refitting without points more than
+# OUTLIER_MADS robust standard deviations (1.4826 * MAD of the residuals)
+# from the curve, starting from the previous tick's curve when there is one.
+# Yields are in percent, so residual scales and cutoffs are too.
+OUTLIER_MADS = 4.0
+MIN_SCALE = 0.01
+MIN_POINTS = 6
+NS_MIN_POINTS = 8
+NSS_MIN_POINTS = 15
+TAU_BOUNDS = (0.25, 30.0)
+TAU_GRID = np.geomspace(*TAU_BOUNDS, 14)
+PLAUSIBLE_BAND = 2.0
+LOG_LAMBDAS = np.linspace(-4, 4, 9)
+SPLINE_SEGMENTS = 8
+CURVE_SERIES = ["GS", "SG"]
+# curve side -> (yield column, fitted column, spread column)
+CURVE_SIDES = {
+    "traded": ("avgyield", "avgfit", "avgspread"),
+    "bid": ("bidyield", "bidfit", "bidspread"),
+    "ask": ("askyield", "askfit", "askspread"),
+}
+CURVE_COLUMNS = [column for _, fit, spread in CURVE_SIDES.values() for column in (fit, spread)]
+
+
+def nss_basis(t, tau1, tau2):
+    # Columns [1, slope, curvature(tau1), curvature(tau2)] for maturities t
+    # (rows) and any number of decay time pairs (leading axes of tau1/tau2)
+    t = np.asarray(t, dtype=float)
+    tau1 = np.asarray(tau1, dtype=float)[..., None]
+    tau2 = np.asarray(tau2, dtype=float)[..., None]
+    x1 = t / tau1
+    x2 = t / tau2
+    e1 = np.exp(-x1)
+    e2 = np.exp(-x2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slope = np.where(x1 > 1e-8, (1 - e1) / x1, 1.0)
+        slope2 = np.where(x2 > 1e-8, (1 - e2) / x2, 1.0)
+    return np.stack(np.broadcast_arrays(np.ones_like(slope), slope, slope - e1, slope2 - e2), axis=-1)
+
+
+def _weighted_solve(basis, y, w, penalty=None):
+    # Least squares coefficients for a stack of design matrices (..., n, k)
+    # through the normal equations, with a tiny ridge against the near
+    # collinear NSS columns. Returns (coefficients, weighted SSE).
+    weighted = np.swapaxes(basis * w[:, None], -1, -2)
+    gram = weighted @ basis
+    if penalty is not None:
+        gram = gram + penalty
+    ridge = 1e-10 * np.trace(gram, axis1=-2, axis2=-1)[..., None, None] * np.eye(basis.shape[-1])
+    coefficients = np.linalg.solve(gram + ridge, (weighted @ y)[..., None])
+    residuals = y - (basis @ coefficients)[..., 0]
+    return coefficients[..., 0], residuals ** 2 @ w
+
+
+class NelsonSiegelSvensson:
+    model = "nss"
+    min_points = NS_MIN_POINTS
+
+    def __init__(self, betas, taus):
+        self.betas = betas
+        self.taus = taus
+        self.scale = self.cutoff = np.nan
+
+    def __call__(self, t):
+        return nss_basis(t, *self.taus) @ self.betas
+
+    @classmethod
+    def fit(cls, t, y, w, previous=None):
+        # The best plausible fit to the points of positive weight, or None
+        # when there are too few of them or no decay times give one
+        fitted = w > 0
+        if fitted.sum() < NS_MIN_POINTS:
+            return None
+        columns = 4 if fitted.sum() >= NSS_MIN_POINTS else 3
+        # Checked on a grid as fine at the short end as the decay times allow
+        grid = np.expm1(np.linspace(np.log1p(t[fitted].min()), np.log1p(t[fitted].max()), 50))
+        low = y[fitted].min() - PLAUSIBLE_BAND
+        high = y[fitted].max() + PLAUSIBLE_BAND
+        tau_min, tau_max = TAU_BOUNDS
+
+        def search(tau1, tau2):
+            # tau2 is kept at least 1.5x tau1 so the two humps stay apart;
+            # implausible fits get an infinite SSE
+            tau1 = np.clip(tau1, tau_min, tau_max / 1.5)
+            tau2 = np.clip(np.maximum(tau2, 1.5 * tau1), tau_min, tau_max)
+            betas, sse = _weighted_solve(nss_basis(t, tau1, tau2)[..., :columns], y, w)
+            betas = np.concatenate([betas, np.zeros(betas.shape[:-1] + (4 - columns,))], axis=-1)
+            curve = (nss_basis(grid, tau1, tau2) @ betas[..., None])[..., 0]
+            plausible = ((betas[..., 0] > 0) & (betas[..., 0] + betas[..., 1] > 0)
+                         & (curve.min(axis=-1) >= low) & (curve.max(axis=-1) <= high))
+            return betas, np.where(plausible, sse, np.inf), tau1, tau2
+
+        if previous is None:
+            tau1, tau2 = (a.ravel() for a in np.meshgrid(TAU_GRID, TAU_GRID, indexing='ij'))
+            keep = tau2 >= 1.5 * tau1
+            betas, sse, tau1, tau2 = search(tau1[keep], tau2[keep])
+            best = np.argmin(sse)
+            if not np.isfinite(sse[best]):
+                return None
+            log_taus, step, iterations = np.log([tau1[best], tau2[best]]), 0.25, 20
+        else:
+            log_taus, step, iterations = np.log(previous.taus), 0.05, 6
+
+        # Pattern search on log decay times: try the eight neighbours and
+        # move to the best, halving the step when none improves the SSE by
+        # more than a hair. The objective is flat along a ridge in the decay
+        # times, so warm starts only take a few steps.
+        offsets = np.array([(i, j) for i in (-1, 0, 1) for j in (-1, 0, 1)], dtype=float)
+        center = 4
+        for _ in range(iterations):
+            betas, sse, tau1, tau2 = search(*np.exp(log_taus + step * offsets).T)
+            best = np.argmin(sse)
+            if not sse[best] < sse[center] * (1 - 1e-4):
+                best = center
+                step /= 2
+                if step < 0.02:
+                    break
+            log_taus = np.log([tau1[best], tau2[best]])
+        if not np.isfinite(sse[best]):
+            # The previous decay times no longer give a plausible curve
+            return cls.fit(t, y, w) if previous is not None else None
+        return cls(betas[best], (tau1[best], tau2[best]))
+
+
+def bspline_basis(x, lo, hi, segments=SPLINE_SEGMENTS):
+    # Uniform cubic B-spline basis (segments + 3 functions) on [lo, hi];
+    # x outside the range is clamped to it
+    h = (hi - lo) / segments
+    position = (np.clip(x, lo, hi) - lo) / h
+    segment = np.minimum(position.astype(int), segments - 1)
+    u = position - segment
+    local = np.stack([(1 - u) ** 3, 3 * u ** 3 - 6 * u ** 2 + 4, -3 * u ** 3 + 3 * u ** 2 + 3 * u + 1, u ** 3], axis=-1) / 6
+    basis = np.zeros((len(x), segments + 3))
+    rows = np.arange(len(x))[:, None]
+    basis[rows, segment[:, None] + np.arange(4)] = local
+    return basis
+
+
+class SmoothingSpline:
+    model = "spline"
+    min_points = MIN_POINTS
+
+    def __init__(self, coefficients, lo, hi, log_lambda):
+        self.coefficients = coefficients
+        self.lo = lo
+        self.hi = hi
+        self.log_lambda = log_lambda
+        self.scale = self.cutoff = np.nan
+
+    def __call__(self, t):
+        return bspline_basis(np.log1p(np.asarray(t, dtype=float)), self.lo, self.hi) @ self.coefficients
+
+    @classmethod
+    def fit(cls, t, y, w, previous=None):
+        x = np.log1p(t)
+        lo, hi = x.min(), x.max()
+        if hi - lo < 1e-6:
+            hi = lo + 1e-6
+        basis = bspline_basis(x, lo, hi)
+        difference = np.diff(np.eye(basis.shape[1]), n=2, axis=0)
+        roughness = difference.T @ difference
+        log_lambdas = LOG_LAMBDAS if previous is None else previous.log_lambda + np.array([-0.5, 0, 0.5])
+        penalties = np.exp(log_lambdas)[:, None, None] * roughness
+        coefficients, sse = _weighted_solve(np.broadcast_to(basis, (len(log_lambdas),) + basis.shape), y, w, penalties)
+
+        # Generalised cross validation: n * SSE / (n - effective dof)^2
+        gram = (basis * w[:, None]).T @ basis
+        dof = np.trace(np.linalg.solve(gram + penalties, np.broadcast_to(gram, penalties.shape)), axis1=-2, axis2=-1)
+        n = w.sum()
+        gcv = n * sse / np.maximum(n - dof, 1) ** 2
+        best = np.nanargmin(gcv)
+        return cls(coefficients[best], lo, hi, log_lambdas[best])
+
+
+def robust_fit(model, t, y, previous=None, rounds=4):
+    # Fit, drop points beyond the cutoff, refit until the inliers settle.
+    # Returns the last curve the model could fit (with its residual scale
+    # and cutoff) or None when there are too few points or it fit none.
+    if len(t) < model.min_points:
+        return None
+    inliers = np.ones(len(t), dtype=bool)
+    if previous is not None:
+        near = np.abs(y - previous(t)) <= previous.cutoff
+        if near.sum() >= model.min_points:
+            inliers = near
+    curve = None
+    for _ in range(rounds):
+        fitted = model.fit(t, y, inliers.astype(float), previous)
+        if fitted is None:
+            break
+        curve = fitted
+        residuals = y - curve(t)
+        curve.scale = max(1.4826 * np.median(np.abs(residuals - np.median(residuals))), MIN_SCALE)
+        curve.cutoff = OUTLIER_MADS * curve.scale
+        updated = np.abs(residuals) <= curve.cutoff
+        if updated.sum() < model.min_points or (updated == inliers).all():
+            break
+        inliers = updated
+    return curve
+
+
+def quoted_rows(data):
+    # (series, side) -> rows of coupon bonds of the series with a live quote
+    # (or a trade) on that side, computed once per snapshot
+    coupon = (data["next coupon date"] != "DNE").to_numpy()
+    series = data["Series"].to_numpy()
+    t = data["nper"].to_numpy(dtype=float)
+    live = {"traded": (data["Volume"] != 0).to_numpy(),
+            "bid": (data["bidquantity"] != 0).to_numpy(),
+            "ask": (data["askquantity"] != 0).to_numpy()}
+    rows = {}
+    for name in CURVE_SERIES:
+        in_series = coupon & (series == name) & np.isfinite(t) & (t > 0)
+        for side, (yield_column, _, _) in CURVE_SIDES.items():
+            y = data[yield_column].to_numpy(dtype=float)
+            rows[name, side] = in_series & live[side] & np.isfinite(y) & (y > 0)
+    return rows
+
+
+class CurveFitter:
+    # Fits every (series, side, model) curve per snapshot, warm-started from
+    # the previous snapshot's curves, and adds the fitted yield and the
+    # spread to the curve (in basis points) of model to the published table.
+    # curves maps (series, side, model) to the latest fit, or None.
+    def __init__(self, model="nss"):
+        self.model = model
+        self.curves = {}
+
+    def fit(self, data, rows):
+        # Each bond contributes one point per side, its best level
+        first = ~data["Symbol"].duplicated().to_numpy()
+        t = data["nper"].to_numpy(dtype=float)
+        curves = {}
+        for (series, side), quoted in rows.items():
+            points = np.flatnonzero(quoted & first)
+            y = data[CURVE_SIDES[side][0]].to_numpy(dtype=float)[points]
+            for model in (NelsonSiegelSvensson, SmoothingSpline):
+                key = (series, side, model.model)
+                previous = self.curves.get(key)
+                try:
+                    curves[key] = robust_fit(model, t[points], y, previous)
+                except np.linalg.LinAlgError:
+                    curves[key] = previous
+        self.curves = curves
+        return curves
+
+    def update(self, data, changed=None):
+        # A tick where nothing changed keeps the curves and only re-applies them
+        rows = quoted_rows(data)
+        if changed or not self.curves:
+            self.fit(data, rows)
+        t = data["nper"].to_numpy(dtype=float)
+        columns = {column: np.full(len(data), np.nan) for column in CURVE_COLUMNS}
+        for (series, side), quoted in rows.items():
+            yield_column, fit_column, spread_column = CURVE_SIDES[side]
+            # Too few points for model falls back to the spline
+            curve = self.curves.get((series, side, self.model)) or self.curves.get((series, side, "spline"))
+            positions = np.flatnonzero(quoted)
+            if curve is None or not len(positions):
+                continue
+            fitted = curve(t[positions])
+            columns[fit_column][positions] = fitted
+            columns[spread_column][positions] = (data[yield_column].to_numpy(dtype=float)[positions] - fitted) * 100
+        return data.assign(**columns)
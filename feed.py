@@ -0,0 +1,241 @@
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+import urllib3
+import zstandard as zstd
+import brotli
+
+DEPTH_LEVELS = 5
+
+
+def decode_body(content):
+    # Bodies are kept exactly as sent on the wire. NSE answers with brotli,
+    # zstd, gzip or deflate depending on the edge; gzip, zstd and zlib
+    # wrapped deflate are recognised by their headers, brotli has none and is
+    # simply tried, then plain UTF-8 and finally raw deflate, which some
+    # servers send for "deflate". Anything else raises ValueError rather
+    # than being passed on as mangled text.
+    if isinstance(content, str):
+        return content
+    if content[:2] == b'\x1f\x8b':
+        return gzip.decompress(content).decode('utf-8')
+    if content[:4] == b'\x28\xb5\x2f\xfd':
+        return zstd.ZstdDecompressor().decompress(content, max_output_size=64 << 20).decode('utf-8')
+    if len(content) >= 2 and content[0] & 0x0f == 8 and int.from_bytes(content[:2], 'big') % 31 == 0:
+        try:
+            return zlib.decompress(content).decode('utf-8')
+        except zlib.error:
+            # Text that happens to start like a zlib header
+            pass
+    try:
+        return brotli.decompress(content).decode('utf-8')
+    except brotli.error:
+        pass
+    try:
+        return content.decode('utf-8')
+    except UnicodeDecodeError:
+        pass
+    try:
+        return zlib.decompress(content, -zlib.MAX_WBITS).decode('utf-8')
+    except zlib.error:
+        raise ValueError(f"Body of {len(content)} bytes is neither compressed nor UTF-8") from None
+
+
+def load_entries(content):
+    return json.loads(decode_body(content))['data']
+
+
+def _as_counts(values):
+    # Quantities and volumes stay integers unless the payload had gaps
+    return values if np.isnan(values).any() else values.astype(np.int64)
+
+
+class DepthParser:
+    # Parser for the liveBonds-traded-on-cm payload. Each depth field is read
+    # once per bond straight into preallocated (bonds, levels) buffers that
+    # are reused across ticks; symbols are kept as codes into a category list
+    # that only grows when a new symbol appears.
+    level_fields = {
+        'bidprice': 'buyPrice',
+        'bidquantity': 'buyQuantity',
+        'askprice': 'sellPrice',
+        'askquantity': 'sellQuantity',
+    }
+    bond_fields = {
+        'Volume': 'totalTradedVolume',
+        'VWATP': 'averagePrice',
+    }
+
+    def __init__(self, levels=DEPTH_LEVELS):
+        self.levels = levels
+        self.capacity = 0
+        self.buffers = {}
+        self.symbol_codes = {}
+        self.symbols = []
+
+    def _reserve(self, bonds):
+        if bonds <= self.capacity:
+            return
+        self.capacity = max(bonds, 2 * self.capacity)
+        self.buffers = {column: np.empty((self.capacity, self.levels)) for column in self.level_fields}
+        self.buffers.update({column: np.empty(self.capacity) for column in self.bond_fields})
+        self.buffers['code'] = np.empty(self.capacity, dtype=np.int32)
+
+    def _codes(self, symbols):
+        codes = self.buffers['code'][:len(symbols)]
+        for i, symbol in enumerate(symbols):
+            code = self.symbol_codes.get(symbol)
+            if code is None:
+                code = self.symbol_codes[symbol] = len(self.symbols)
+                self.symbols.append(symbol)
+            codes[i] = code
+        return codes
+
+    def parse(self, content):
+        return self.parse_entries(load_entries(content))
+
+    def parse_entries(self, entries):
+        bonds = len(entries)
+        self._reserve(bonds)
+        for column, field in self.level_fields.items():
+            buffer = self.buffers[column]
+            for level in range(self.levels):
+                key = f'{field}{level + 1}'
+                buffer[:bonds, level] = [entry[key] for entry in entries]
+        for column, field in self.bond_fields.items():
+            self.buffers[column][:bonds] = [entry[field] for entry in entries]
+        codes = self._codes([entry['symbol'] for entry in entries])
+
+        # Rows come out bond-major, one per depth level, like the old flattening
+        rows = bonds * self.levels
+        quantities = {column: _as_counts(self.buffers[column][:bonds].reshape(rows)) for column in ('bidquantity', 'askquantity')}
+        symbols = pd.Categorical.from_codes(np.repeat(codes, self.levels), categories=self.symbols)
+        bid_ask = pd.DataFrame({
+            'Symbol': symbols,
+            'Series': np.repeat(np.array([entry['series'] for entry in entries], dtype=object), self.levels),
+            'ISIN': np.repeat(np.array([entry['isinCode'] for entry in entries], dtype=object), self.levels),
+            'bidprice': self.buffers['bidprice'][:bonds].reshape(rows),
+            'bidquantity': quantities['bidquantity'],
+            'askprice': self.buffers['askprice'][:bonds].reshape(rows),
+            'askquantity': quantities['askquantity'],
+            'Volume': _as_counts(np.repeat(self.buffers['Volume'][:bonds], self.levels)),
+            'VWATP': np.repeat(self.buffers['VWATP'][:bonds], self.levels),
+        }, copy=True)
+        return bid_ask
+
+
+class FetchError(Exception):
+    pass
+
+
+class Fetcher:
+    # One pooled keep-alive session for every NSE request. Cookies from the
+    # home page are reused until cookie_ttl runs out or the API answers
+    # 401/403. Failed requests are retried with jittered exponential backoff,
+    # and poll() fetches several endpoints concurrently, falling back to the
+    # last good body for any endpoint that fails. Per URL request, error,
+    # fallback and status counts and timings are kept in stats, and fresh_at
+    # holds the time of the last body that was not a fallback. Bodies are
+    # returned still compressed (see decode_body) and handed to
+    # recorder.save() if one is set.
+    def __init__(self, base_url, headers, cookie_ttl=300, timeout=(3.05, 10), retries=3,
+                 backoff=0.5, backoff_cap=8, workers=4, recorder=None):
+        self.base_url = base_url
+        self.recorder = recorder
+        self.cookie_ttl = cookie_ttl
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_cap = backoff_cap
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=workers, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update(headers)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='fetch')
+        self.cookie_lock = threading.Lock()
+        self.cookies_at = None
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+        self.last_good = {}
+        self.fresh_at = {}
+
+    def refresh_cookies(self, force=False):
+        with self.cookie_lock:
+            if not force and self.cookies_at is not None and time.monotonic() - self.cookies_at < self.cookie_ttl:
+                return
+            response = self.session.get(self.base_url, timeout=self.timeout)
+            self._record(self.base_url, response.elapsed.total_seconds(), response.status_code)
+            if response.status_code != 200:
+                raise FetchError(f"Failed to get new cookies: {response.status_code}")
+            self.session.cookies.update(response.cookies.get_dict())
+            self.cookies_at = time.monotonic()
+
+    def _stats(self, url):
+        return self.stats.setdefault(url, {'requests': 0, 'errors': 0, 'fallbacks': 0, 'total_seconds': 0.0,
+                                           'max_seconds': 0.0, 'last_seconds': 0.0, 'status': {}})
+
+    def _record(self, url, seconds, status):
+        with self.stats_lock:
+            stats = self._stats(url)
+            stats['requests'] += 1
+            stats['errors'] += status != 200
+            stats['total_seconds'] += seconds
+            stats['max_seconds'] = max(stats['max_seconds'], seconds)
+            stats['last_seconds'] = seconds
+            stats['status'][status] = stats['status'].get(status, 0) + 1
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter: anywhere between zero and the exponential cap
+        time.sleep(random.uniform(0, min(self.backoff_cap, self.backoff * 2 ** attempt)))
+
+    def get(self, url):
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._sleep_before_retry(attempt - 1)
+            started = time.perf_counter()
+            try:
+                self.refresh_cookies()
+                response = self.session.get(url, timeout=self.timeout, stream=True)
+                content = response.raw.read(decode_content=False)
+                response.close()
+            except (requests.RequestException, urllib3.exceptions.HTTPError, FetchError) as e:
+                self._record(url, time.perf_counter() - started, type(e).__name__)
+                error = e
+                continue
+            self._record(url, time.perf_counter() - started, response.status_code)
+            if response.status_code == 200:
+                if self.recorder is not None:
+                    self.recorder.save(url, content)
+                return content
+            if response.status_code in (401, 403):
+                # Cookies went stale before the TTL did
+                self.cookies_at = None
+            error = FetchError(f"{url} returned {response.status_code}")
+        raise FetchError(f"{url} failed after {self.retries + 1} attempts") from error
+
+    def poll(self, urls):
+        futures = {url: self.executor.submit(self.get, url) for url in urls}
+        bodies = {}
+        for url, future in futures.items():
+            try:
+                bodies[url] = self.last_good[url] = future.result()
+                self.fresh_at[url] = time.time()
+            except FetchError as e:
+                if url in self.last_good:
+                    with self.stats_lock:
+                        self._stats(url)['fallbacks'] += 1
+                    print(f"{e}; using last good snapshot")
+                    bodies[url] = self.last_good[url]
+                else:
+                    print(e)
+        return bodies
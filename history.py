@@ -0,0 +1,200 @@
+import json
+import os
+import threading
+from datetime import date, datetime
+import numpy as np
+import pandas as pd
+from refdata import CACHE_DIR
+
+# Intraday tick history
+#
+# Each trading day is one append-only file of fixed-width records, mapped
+# with np.memmap and grown by doubling. Only rows of symbols that changed in
+# a tick are appended. A sidecar JSON file holds the symbol list the
+# records' codes point into. The most recent rows are also kept in an
+# in-memory ring buffer, and a per-symbol index of (row, timestamp) makes
+# range queries a searchsorted instead of a scan. At rollover the file is
+# truncated to its used length and files past the retention are deleted.
+HISTORY_DIR = os.environ.get("DEBTVIEW_HISTORY_DIR", os.path.join(CACHE_DIR, "history"))
+RECORD = np.dtype([
+    ('ts', 'f8'), ('symbol', 'i4'), ('level', 'u1'),
+    ('bidprice', 'f4'), ('askprice', 'f4'), ('VWATP', 'f4'),
+    ('bidyield', 'f4'), ('askyield', 'f4'), ('avgyield', 'f4'),
+    ('bidquantity', 'i4'), ('askquantity', 'i4'), ('Volume', 'i8'),
+])
+VALUE_COLUMNS = [name for name in RECORD.names if name not in ('ts', 'symbol', 'level')]
+
+
+class _Growable:
+    def __init__(self, dtype):
+        self.values = np.empty(64, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        needed = self.size + len(values)
+        if needed > len(self.values):
+            grown = np.empty(max(needed, 2 * len(self.values)), dtype=self.values.dtype)
+            grown[:self.size] = self.values[:self.size]
+            self.values = grown
+        self.values[self.size:needed] = values
+        self.size = needed
+
+    def view(self):
+        return self.values[:self.size]
+
+
+class TickHistory:
+    def __init__(self, directory=HISTORY_DIR, ring_size=200_000, retention_days=5, initial_rows=1 << 16):
+        self.directory = directory
+        self.ring_size = ring_size
+        self.retention_days = retention_days
+        self.initial_rows = initial_rows
+        self.lock = threading.Lock()
+        self.day = None
+        os.makedirs(directory, exist_ok=True)
+        self._open(date.today())
+
+    def _paths(self, day):
+        base = os.path.join(self.directory, day.isoformat())
+        return f"{base}.ticks", f"{base}.json"
+
+    def _open(self, day):
+        self.day = day
+        self.log_path, self.meta_path = self._paths(day)
+        self.symbols = []
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                self.symbols = json.load(f)["symbols"]
+        self.codes = {symbol: code for code, symbol in enumerate(self.symbols)}
+
+        rows = os.path.getsize(self.log_path) // RECORD.itemsize if os.path.exists(self.log_path) else 0
+        self.capacity = max(rows, self.initial_rows)
+        self.log = self._map(self.capacity)
+        # Unused slots are zero, so the used length is the count of stamped rows
+        self.rows = int(np.count_nonzero(self.log['ts'][:rows]))
+
+        self.ring = np.zeros(self.ring_size, dtype=RECORD)
+        tail = self.log[max(0, self.rows - self.ring_size):self.rows]
+        self.ring[np.arange(self.rows - len(tail), self.rows) % self.ring_size] = tail
+
+        self.index = {}
+        if self.rows:
+            # Rebuild the per-symbol index from the log in one pass
+            symbols = self.log['symbol'][:self.rows]
+            order = np.argsort(symbols, kind='stable')
+            bounds = np.flatnonzero(np.diff(symbols[order])) + 1
+            for group in np.split(order, bounds):
+                entry = self.index[int(symbols[group[0]])] = (_Growable(np.int64), _Growable(np.float64))
+                entry[0].extend(group)
+                entry[1].extend(self.log['ts'][group])
+
+    def _map(self, capacity):
+        mode = 'r+' if os.path.exists(self.log_path) else 'w+'
+        with open(self.log_path, 'ab') as f:
+            f.truncate(max(os.path.getsize(self.log_path), capacity * RECORD.itemsize))
+        return np.memmap(self.log_path, dtype=RECORD, mode=mode, shape=(capacity,))
+
+    def _write_meta(self):
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"symbols": self.symbols, "rows": self.rows}, f)
+        os.replace(tmp_path, self.meta_path)
+
+    def _code(self, symbol):
+        code = self.codes.get(symbol)
+        if code is None:
+            code = self.codes[symbol] = len(self.symbols)
+            self.symbols.append(symbol)
+        return code
+
+    def append(self, data, changed, ts=None):
+        # Appends the rows of the changed symbols in data (the published
+        # snapshot frame), stamped with ts
+        ts = datetime.now().timestamp() if ts is None else ts
+        rows = data[data["Symbol"].isin(changed)]
+        if rows.empty:
+            return 0
+        with self.lock:
+            if date.fromtimestamp(ts) != self.day:
+                self._rollover(date.fromtimestamp(ts))
+            known = len(self.symbols)
+            records = np.zeros(len(rows), dtype=RECORD)
+            records['ts'] = ts
+            records['symbol'] = [self._code(symbol) for symbol in rows["Symbol"]]
+            records['level'] = rows.groupby("Symbol", sort=False).cumcount().to_numpy()
+            for name in VALUE_COLUMNS:
+                values = rows[name]
+                records[name] = values.to_numpy() if RECORD[name].kind == 'f' else values.fillna(0).to_numpy()
+
+            start, end = self.rows, self.rows + len(records)
+            if end > self.capacity:
+                self.log.flush()
+                self.capacity = max(end, 2 * self.capacity)
+                self.log = self._map(self.capacity)
+            self.log[start:end] = records
+            self.ring[np.arange(start, end) % self.ring_size] = records
+            self.rows = end
+
+            positions = np.arange(start, end)
+            order = np.argsort(records['symbol'], kind='stable')
+            bounds = np.flatnonzero(np.diff(records['symbol'][order])) + 1
+            for group in np.split(order, bounds):
+                code = int(records['symbol'][group[0]])
+                entry = self.index.get(code)
+                if entry is None:
+                    entry = self.index[code] = (_Growable(np.int64), _Growable(np.float64))
+                entry[0].extend(positions[group])
+                entry[1].extend(records['ts'][group])
+            if len(self.symbols) != known:
+                self._write_meta()
+            return len(records)
+
+    def _records(self, positions):
+        # Served from the ring when every row is still in the hot window
+        if len(positions) and positions[0] >= self.rows - self.ring_size:
+            return self.ring[positions % self.ring_size]
+        return np.asarray(self.log[positions])
+
+    def query(self, symbol, start=None, end=None, level=None):
+        # Rows of one symbol with start <= ts < end, as a DataFrame indexed by time
+        with self.lock:
+            code = self.codes.get(symbol)
+            entry = self.index.get(code)
+            if entry is None:
+                return pd.DataFrame(columns=['level'] + VALUE_COLUMNS)
+            positions, stamps = entry[0].view(), entry[1].view()
+            lo = 0 if start is None else np.searchsorted(stamps, start, side='left')
+            hi = len(stamps) if end is None else np.searchsorted(stamps, end, side='left')
+            records = self._records(positions[lo:hi])
+        frame = pd.DataFrame({name: records[name] for name in ['level'] + VALUE_COLUMNS},
+                             index=pd.to_datetime(records['ts'], unit='s', utc=True).tz_convert('Asia/Kolkata'))
+        if level is not None:
+            frame = frame[frame['level'] == level]
+        return frame
+
+    def _rollover(self, day):
+        # Compact the finished day to its used length and start a new file
+        self.log.flush()
+        del self.log
+        with open(self.log_path, 'r+b') as f:
+            f.truncate(self.rows * RECORD.itemsize)
+        self._write_meta()
+        self._expire(day)
+        self._open(day)
+
+    def _expire(self, today):
+        days = sorted(name[:-len('.ticks')] for name in os.listdir(self.directory) if name.endswith('.ticks'))
+        for name in days:
+            if (today - date.fromisoformat(name)).days > self.retention_days:
+                for path in self._paths(date.fromisoformat(name)):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def rollover(self, day=None):
+        with self.lock:
+            self._rollover(day or date.today())
+
+    def close(self):
+        with self.lock:
+            self.log.flush()
+            self._write_meta()
@@ -0,0 +1,95 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from refdata import CACHE_DIR
+
+# In-process instrumentation
+#
+# Stage timings, counters and gauges kept in memory: per stage a bounded
+# deque of recent durations plus running count and total, and one shared
+# ring of the most recent (time, stage, seconds) measurements. Recording is
+# a perf_counter pair and an append under a lock, cheap enough to leave on.
+# summary() is what the Diagnostics page shows and what the ingestion
+# service writes to METRICS_PATH after every cycle; its 'recent' list is the
+# ring as [time, stage, ms], for the timeline of individual measurements.
+METRICS_PATH = os.environ.get("DEBTVIEW_METRICS_PATH", os.path.join(CACHE_DIR, "metrics.json"))
+
+
+class Metrics:
+    # size bounds the samples kept per stage (None keeps everything, for
+    # benchmarks); recent bounds the shared ring of measurements
+    def __init__(self, size=512, recent=1024):
+        self.size = size
+        self.lock = threading.Lock()
+        self.samples = {}
+        self.totals = {}
+        self.counters = {}
+        self.gauges = {}
+        self.recent = deque(maxlen=recent)
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name, seconds):
+        with self.lock:
+            samples = self.samples.get(name)
+            if samples is None:
+                samples = self.samples[name] = deque(maxlen=self.size)
+                self.totals[name] = [0, 0.0]
+            samples.append(seconds)
+            totals = self.totals[name]
+            totals[0] += 1
+            totals[1] += seconds
+            self.recent.append((time.time(), name, seconds))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def percentiles(self, name, qs=(50, 90, 99)):
+        with self.lock:
+            samples = np.array(self.samples.get(name, ()))
+        if samples.size == 0:
+            return {q: float('nan') for q in qs}
+        return dict(zip(qs, np.percentile(samples, qs)))
+
+    def summary(self):
+        with self.lock:
+            samples = {name: np.array(values) for name, values in self.samples.items()}
+            totals = {name: tuple(values) for name, values in self.totals.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            recent = [[at, name, seconds * 1000] for at, name, seconds in self.recent]
+        stages = {}
+        for name, values in samples.items():
+            p50, p90, p99 = np.percentile(values, (50, 90, 99)) if values.size else (float('nan'),) * 3
+            stages[name] = {'count': totals[name][0], 'total_seconds': totals[name][1],
+                            'last_ms': values[-1] * 1000 if values.size else float('nan'),
+                            'p50_ms': p50 * 1000, 'p90_ms': p90 * 1000, 'p99_ms': p99 * 1000}
+        return {'stages': stages, 'counters': counters, 'gauges': gauges, 'recent': recent}
+
+    def recent_measurements(self):
+        with self.lock:
+            return list(self.recent)
+
+
+def write_json(report, path=METRICS_PATH):
+    # Write then rename so a reader (curl, tail, a scraper) never sees half a file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(report, f, default=str)
+    os.replace(tmp_path, path)
@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+from bondmath import batch_yields
+
+MASTER_COLUMNS = ['Symbol', ' IP RATE', ' REDEMPTION DATE', "settlement date", "next coupon date", "last coupon date", "Days Between", "Accrued Interest", "nper", "days to maturity"]
+YIELD_COLUMNS = ["next coupon date", "Symbol", "bidquantity", "bidyield", "bidprice", "askprice", "askyield", "askquantity", "Volume", "VWATP", "avgyield", "Series", "nper"]
+
+
+def price_depth(bid_ask, master_debt, previous=None):
+    # Clean prices and yields for depth rows. previous is an earlier output
+    # of this function used to warm-start the yield solver.
+    bid_ask = bid_ask.copy()
+    bid_ask.Symbol = bid_ask.Symbol.astype(str)
+    bid_ask = bid_ask.merge(master_debt[MASTER_COLUMNS], how="left", on="Symbol")
+    bid_ask["clean_bid_price"] = bid_ask["bidprice"] - bid_ask["Accrued Interest"]
+    bid_ask["clean_ask_price"] = bid_ask["askprice"] - bid_ask["Accrued Interest"]
+    bid_ask["clean_avg_price"] = bid_ask["VWATP"] - bid_ask["Accrued Interest"]
+    bid_ask.fillna({"ISIN": "TEST"}, inplace=True)
+    bid_ask = bid_ask.dropna().reset_index(drop=True)
+
+    # Solve ask, bid and VWAP yields for every row in one batch,
+    # warm-started from the previous tick's yields for the same depth level
+    bid_ask["level"] = bid_ask.groupby("Symbol").cumcount()
+    keys = pd.MultiIndex.from_frame(bid_ask[["Symbol", "level"]])
+    guess = None
+    if previous is not None and not previous.empty:
+        guess = previous.set_index(["Symbol", "level"])[["askyield", "bidyield", "avgyield"]].reindex(keys).to_numpy()
+    yields, converged = batch_yields(bid_ask[" IP RATE"].to_numpy(), bid_ask["nper"].to_numpy(), bid_ask["days to maturity"].to_numpy(),
+                                     bid_ask[["askprice", "bidprice", "VWATP"]].to_numpy(),
+                                     bid_ask[["clean_ask_price", "clean_bid_price", "clean_avg_price"]].to_numpy(), guess)
+    if not converged.all():
+        print("yield solver did not converge for", (~converged).sum(), "prices")
+    bid_ask["askyield"] = yields[:, 0]
+    bid_ask["bidyield"] = yields[:, 1]
+    bid_ask["avgyield"] = yields[:, 2]
+    return bid_ask
+
+
+def final_yields(priced):
+    final_yield = priced[YIELD_COLUMNS].copy()
+    final_yield["bidyield"] = final_yield["bidyield"] * 100
+    final_yield["askyield"] = final_yield["askyield"] * 100
+    final_yield["avgyield"] = final_yield["avgyield"] * 100
+    return final_yield
+
+
+# Depth columns compared between polls, and the price sides in the order
+# batch_yields solves them
+CHANGE_COLUMNS = ["bidprice", "bidquantity", "askprice", "askquantity", "Volume", "VWATP"]
+PRICE_SIDES = ["askprice", "bidprice", "VWATP"]
+
+
+def depth_levels(groups, count):
+    # Position of every row within its group (0 for the best level), for
+    # group ids in 0..count-1 in any row order
+    order = np.argsort(groups, kind="stable")
+    sizes = np.bincount(groups, minlength=count)
+    levels = np.empty(len(groups), dtype=np.intp)
+    levels[order] = np.arange(len(groups)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    return levels, sizes
+
+
+class MasterArrays:
+    # master_debt indexed by Symbol once per master version: the per bond
+    # inputs of the yield solver and the reference columns of the output.
+    # Bonds with missing reference data are left out, as price_depth's
+    # dropna does; a symbol listed twice keeps its first row.
+    def __init__(self, master_debt):
+        master_debt = master_debt[master_debt[MASTER_COLUMNS].notna().all(axis=1)].drop_duplicates("Symbol")
+        self.symbols = pd.Index(master_debt["Symbol"].astype(str).to_numpy())
+        self.coupon = master_debt[" IP RATE"].to_numpy(dtype=float)
+        self.accrued = master_debt["Accrued Interest"].to_numpy(dtype=float)
+        self.nper = master_debt["nper"].to_numpy(dtype=float)
+        self.days = master_debt["days to maturity"].to_numpy(dtype=float)
+        self.next_coupon = master_debt["next coupon date"].to_numpy()
+
+
+class IncrementalPricer:
+    # Prices the depth table into the published yield table, solving yields
+    # only for the symbols whose depth changed since the last poll. State is
+    # kept as arrays per depth row: while the payload lists the same rows in
+    # the same order (the usual case) changes are found by comparing the
+    # depth columns positionally; otherwise rows are matched on (Symbol,
+    # level). A symbol counts as changed when any of its rows changed or it
+    # gained or lost a level. After update(), changed holds the symbols that
+    # were repriced, added or removed this tick. With an executor (a process
+    # pool), solving for at least min_shard_symbols symbols is split into
+    # shards of rows and solved in parallel.
+    def __init__(self, executor=None, shards=1, min_shard_symbols=64):
+        self.executor = executor
+        self.shards = shards
+        self.min_shard_symbols = min_shard_symbols
+        self.master_debt = None
+        self.master = None
+        self.layout = None
+        self.depth = None
+        self.yields = None
+        self.result = None
+        self.changed = frozenset()
+
+    def _layout(self, symbols, series):
+        # Per row group ids, levels and master positions for a row order
+        groups, unique = pd.factorize(symbols)
+        levels, sizes = depth_levels(groups, len(unique))
+        bonds = self.master.symbols.get_indexer(unique)[groups]
+        valid = (bonds >= 0) & pd.notna(series)
+        return {"symbols": symbols, "unique": pd.Index(unique), "groups": groups, "levels": levels, "sizes": sizes,
+                "bonds": bonds, "valid": valid}
+
+    def _solve(self, layout, rows, quoted, guess):
+        bonds = layout["bonds"][rows]
+        args = (self.master.coupon[bonds], self.master.nper[bonds], self.master.days[bonds], quoted,
+                quoted - self.master.accrued[bonds][:, None], guess)
+        symbols = len(np.unique(layout["groups"][rows]))
+        if self.executor is None or self.shards < 2 or symbols < self.min_shard_symbols:
+            return batch_yields(*args)
+        # Rows are independent, so any split works
+        futures = [self.executor.submit(batch_yields, *(arg[shard] for arg in args))
+                   for shard in np.array_split(np.arange(len(rows)), self.shards)]
+        results = [future.result() for future in futures]
+        return np.concatenate([r[0] for r in results]), np.concatenate([r[1] for r in results])
+
+    def update(self, bid_ask, master_debt):
+        symbols = bid_ask["Symbol"].to_numpy()
+        if symbols.dtype != object:
+            symbols = symbols.astype(str).astype(object)
+        columns = {column: bid_ask[column].to_numpy() for column in CHANGE_COLUMNS}
+        depth = np.column_stack([columns[column] for column in CHANGE_COLUMNS]).astype(float)
+        reprice_all = self.master is None or master_debt is not self.master_debt
+        if reprice_all:
+            self.master = MasterArrays(master_debt)
+        previous = self.layout
+
+        if previous is not None and not reprice_all and np.array_equal(symbols, previous["symbols"]):
+            # Same rows in the same order
+            layout = previous
+            matched = np.arange(len(symbols))
+            same = ((depth == self.depth) | (np.isnan(depth) & np.isnan(self.depth))).all(axis=1)
+            stale_groups = np.bincount(layout["groups"][~same], minlength=len(layout["unique"])) > 0
+            removed = set()
+        else:
+            layout = self._layout(symbols, bid_ask["Series"].to_numpy())
+            stale_groups = np.ones(len(layout["unique"]), dtype=bool)
+            matched = np.full(len(symbols), -1)
+            removed = set()
+            if previous is not None:
+                # Match rows on (Symbol, level) through a (symbol, level) table of previous rows
+                before = previous["unique"].get_indexer(layout["unique"])
+                table = np.full((len(previous["unique"]), max(previous["sizes"].max(initial=0), 1)), -1)
+                table[previous["groups"], previous["levels"]] = np.arange(len(previous["groups"]))
+                known = (before[layout["groups"]] >= 0) & (layout["levels"] < table.shape[1])
+                matched[known] = table[before[layout["groups"]][known], layout["levels"][known]]
+                if not reprice_all:
+                    hit = matched >= 0
+                    same = np.zeros(len(symbols), dtype=bool)
+                    same[hit] = ((depth[hit] == self.depth[matched[hit]])
+                                 | (np.isnan(depth[hit]) & np.isnan(self.depth[matched[hit]]))).all(axis=1)
+                    sizes_before = np.where(before >= 0, previous["sizes"][before], -1)
+                    stale_groups = (np.bincount(layout["groups"][~same], minlength=len(layout["unique"])) > 0) | (sizes_before != layout["sizes"])
+                removed = set(previous["unique"].difference(layout["unique"]))
+
+        # Carry yields over, then solve the rows of changed symbols, warm
+        # started from the same row's previous yields
+        yields = np.full((len(symbols), 3), np.nan)
+        if self.yields is not None:
+            yields[matched >= 0] = self.yields[matched[matched >= 0]]
+        valid = layout["valid"] & ~np.isnan(depth).any(axis=1)
+        stale = stale_groups[layout["groups"]] & valid
+        if stale.any():
+            rows = np.flatnonzero(stale)
+            quoted = np.column_stack([columns[side][rows] for side in PRICE_SIDES]).astype(float)
+            solved, converged = self._solve(layout, rows, quoted, yields[rows])
+            if not converged.all():
+                print("yield solver did not converge for", (~converged).sum(), "prices")
+            yields[rows] = solved
+
+        changed = set(layout["unique"][stale_groups]) | removed
+        if self.result is None or changed or layout is not previous:
+            rows = np.flatnonzero(valid)
+            bonds = layout["bonds"][rows]
+            self.result = pd.DataFrame({
+                "next coupon date": self.master.next_coupon[bonds],
+                "Symbol": symbols[rows],
+                "bidquantity": columns["bidquantity"][rows],
+                "bidyield": yields[rows, 1] * 100,
+                "bidprice": columns["bidprice"][rows],
+                "askprice": columns["askprice"][rows],
+                "askyield": yields[rows, 0] * 100,
+                "askquantity": columns["askquantity"][rows],
+                "Volume": columns["Volume"][rows],
+                "VWATP": columns["VWATP"][rows],
+                "avgyield": yields[rows, 2] * 100,
+                "Series": bid_ask["Series"].to_numpy()[rows],
+                "nper": self.master.nper[bonds],
+            })
+        self.layout = layout
+        self.depth = depth
+        self.yields = yields
+        self.master_debt = master_debt
+        self.changed = frozenset(changed)
+        # A shallow copy, so callers can replace columns without touching the kept result
+        return self.result.copy(deep=False)
@@ -0,0 +1,95 @@
+import os
+from datetime import date
+from io import StringIO
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from bondmath import coupon_schedule, parse_dates
+
+# Reference data cache
+#
+# The enriched master_debt table is stored as an uncompressed Arrow IPC file
+# so it can be memory-mapped on startup. The schema metadata records the
+# date DEBT.csv was downloaded (source date) and the settlement date the
+# coupon columns were computed for. A new settlement date only recomputes
+# the settlement columns; a new source date means the CSV has to be fetched
+# again, which callers do in the background while serving the cached copy.
+DEBT_URL = "https://nsearchives.nseindia.com/content/equities/DEBT.csv"
+CACHE_DIR = os.environ.get("DEBTVIEW_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache"))
+CACHE_PATH = os.path.join(CACHE_DIR, "master_debt.arrow")
+SETTLEMENT_COLUMNS = ["settlement date", "next coupon date", "last coupon date", "Days Between", "Accrued Interest", "nper", "days to maturity"]
+
+
+def build_master_debt(csv_text, settlement_date):
+    master_debt = pd.read_csv(StringIO(csv_text), index_col=False)
+    master_debt = master_debt[["SYMBOL", " IP RATE", " REDEMPTION DATE"]]
+    master_debt = master_debt.rename(columns={'SYMBOL': 'Symbol'})
+    master_debt.Symbol = master_debt.Symbol.astype(str)
+    master_debt = master_debt.fillna({' IP RATE': 0})
+    master_debt = master_debt.dropna().reset_index(drop=True)
+    master_debt[" REDEMPTION DATE"] = master_debt[" REDEMPTION DATE"].astype(str)
+    redemption_dates = parse_dates(master_debt[" REDEMPTION DATE"], "%d-%b-%Y")
+    master_debt = master_debt[~np.isnat(redemption_dates)].reset_index(drop=True)
+    return roll_settlement(master_debt, settlement_date)
+
+
+def roll_settlement(master_debt, settlement_date):
+    # Recompute only the settlement dependent columns
+    master_debt = master_debt.drop(columns=SETTLEMENT_COLUMNS, errors='ignore')
+    redemption_dates = parse_dates(master_debt[" REDEMPTION DATE"], "%d-%b-%Y")
+    schedule = coupon_schedule(redemption_dates, master_debt[' IP RATE'].to_numpy(), settlement_date)
+    master_debt[schedule.columns] = schedule
+    return master_debt
+
+
+def ensure_settlement(master_debt, settlement_date):
+    if not master_debt.empty and master_debt["settlement date"].iat[0] == settlement_date:
+        return master_debt
+    return roll_settlement(master_debt, settlement_date)
+
+
+def read_cache(path=CACHE_PATH):
+    # Returns (master_debt, source_date, settlement_date), or Nones if the
+    # cache is missing or unreadable
+    try:
+        table = feather.read_table(path, memory_map=True)
+    except (OSError, pa.ArrowInvalid):
+        return None, None, None
+    metadata = table.schema.metadata or {}
+    return (table.to_pandas(),
+            metadata.get(b"source_date", b"").decode(),
+            metadata.get(b"settlement_date", b"").decode())
+
+
+def write_cache(master_debt, source_date, path=CACHE_PATH):
+    table = pa.Table.from_pandas(master_debt, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[b"source_date"] = source_date.encode()
+    metadata[b"settlement_date"] = master_debt["settlement date"].iat[0].encode() if len(master_debt) else b""
+    table = table.replace_schema_metadata(metadata)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so readers never see a partial file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    feather.write_feather(table, tmp_path, compression="uncompressed")
+    os.replace(tmp_path, path)
+
+
+def refresh_master_debt(fetch_csv, settlement_date, path=CACHE_PATH, today=None):
+    source_date = (today or date.today()).isoformat()
+    master_debt = build_master_debt(fetch_csv(), settlement_date)
+    write_cache(master_debt, source_date, path)
+    return master_debt
+
+
+def load_master_debt(fetch_csv, settlement_date, path=CACHE_PATH, today=None):
+    # Returns (master_debt, stale). Only fetches synchronously when there is
+    # no usable cache; a stale cache is returned as is for the caller to
+    # refresh in the background.
+    master_debt, source_date, cached_settlement = read_cache(path)
+    if master_debt is None:
+        return refresh_master_debt(fetch_csv, settlement_date, path, today), False
+    if cached_settlement != settlement_date:
+        master_debt = roll_settlement(master_debt, settlement_date)
+        write_cache(master_debt, source_date, path)
+    return master_debt, source_date != (today or date.today()).isoformat()
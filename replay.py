@@ -0,0 +1,267 @@
+import argparse
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from http.cookies import SimpleCookie
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+import pyarrow as pa
+from alerts import AlertEngine, load_rules
+from charts import MarketCharts
+from refdata import DEBT_URL
+from risk import load_holdings
+from service import IngestionService
+from views import TABLE_PAGES, ViewCache
+
+# Record and replay
+#
+# With DEBTVIEW_RECORD_DIR set, the app's fetcher hands every successful
+# body to a Recorder, which stores it exactly as received (still compressed)
+# next to a manifest.jsonl line with the timestamp and URL. replay() feeds a
+# recording back through the same IngestionService the app uses and then
+# through the page views and charts, either paced like the original session
+# or as fast as possible.
+RECORD_DIR = os.environ.get("DEBTVIEW_RECORD_DIR")
+
+Record = namedtuple('Record', 'ts url content')
+
+
+class Recorder:
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, url, content, ts=None):
+        ts = time.time() if ts is None else ts
+        name = f"{ts:.3f}-{re.sub(r'[^A-Za-z0-9.]+', '-', url.split('://')[-1]).strip('-')}.body"
+        with self.lock:
+            with open(os.path.join(self.directory, name), 'wb') as f:
+                f.write(content)
+            with open(os.path.join(self.directory, 'manifest.jsonl'), 'a') as f:
+                f.write(json.dumps({'ts': ts, 'url': url, 'file': name}) + '\n')
+
+
+def load_recording(directory):
+    records = []
+    with open(os.path.join(directory, 'manifest.jsonl')) as f:
+        for line in f:
+            entry = json.loads(line)
+            with open(os.path.join(directory, entry['file']), 'rb') as body:
+                records.append(Record(entry['ts'], entry['url'], body.read()))
+    return sorted(records, key=lambda record: record.ts)
+
+
+class ReplayFetcher:
+    # Stands in for feed.Fetcher. Live bodies are grouped into ticks (a tick
+    # ends when an endpoint repeats) and poll() serves the current tick;
+    # get() serves the recorded DEBT.csv.
+    def __init__(self, records):
+        self.master = None
+        self.ticks = []
+        current = {}
+        for record in records:
+            if record.url == DEBT_URL:
+                self.master = self.master or record.content
+                continue
+            if record.url in current:
+                self.ticks.append((min(r.ts for r in current.values()), {url: r.content for url, r in current.items()}))
+                current = {}
+            current[record.url] = record
+        if current:
+            self.ticks.append((min(r.ts for r in current.values()), {url: r.content for url, r in current.items()}))
+        if self.master is None:
+            raise ValueError("Recording has no DEBT.csv")
+        self.urls = sorted({url for _, bodies in self.ticks for url in bodies})
+        self.position = 0
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+        self.fresh_at = {}
+
+    @property
+    def now(self):
+        return self.ticks[min(self.position, len(self.ticks) - 1)][0]
+
+    def get(self, url):
+        if url == DEBT_URL:
+            return self.master
+        return self.ticks[self.position][1][url]
+
+    def poll(self, urls):
+        bodies = self.ticks[self.position][1]
+        self.fresh_at.update(dict.fromkeys(bodies, time.time()))
+        return {url: bodies[url] for url in urls if url in bodies}
+
+
+class ReplayServer:
+    # Local stand-in for the NSE endpoints, for exercising the real Fetcher
+    # offline. Every recorded URL is served on localhost at its path and
+    # query; successive requests to a path step through its recorded bodies
+    # and then repeat the last one. Like NSE, the home page (/) hands out a
+    # cookie and API paths answer 401 without the current one;
+    # expire_cookies() makes the next API request fail with 403 until the
+    # home page is fetched again. faults maps a path to statuses answered
+    # once each before it serves bodies again; fail() makes a path answer a
+    # status until recover(). requests counts hits per path.
+    def __init__(self, records, faults=None, host='127.0.0.1', port=0):
+        self.bodies = {}
+        for record in records:
+            self.bodies.setdefault(self.path(record.url), []).append(record.content)
+        self.served = dict.fromkeys(self.bodies, 0)
+        self.faults = {path: list(statuses) for path, statuses in (faults or {}).items()}
+        self.failing = {}
+        self.requests = {}
+        self.cookie = None
+        self.cookie_version = 0
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.base_url = f"http://{host}:{self.httpd.server_address[1]}"
+        self.thread = None
+
+    @staticmethod
+    def path(url):
+        parts = urlsplit(url)
+        return parts.path + (f"?{parts.query}" if parts.query else "")
+
+    def url(self, recorded_url):
+        return self.base_url + self.path(recorded_url)
+
+    def expire_cookies(self):
+        with self.lock:
+            self.cookie = None
+
+    def fail(self, path, status=500):
+        with self.lock:
+            self.failing[path] = status
+
+    def recover(self, path):
+        with self.lock:
+            self.failing.pop(path, None)
+
+    def _respond(self, path, cookie):
+        # (status, body, headers) for one request
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+            if path == '/':
+                self.cookie_version += 1
+                self.cookie = f"session-{self.cookie_version}"
+                return 200, b'<html></html>', {'Set-Cookie': f"nsit={self.cookie}; Path=/"}
+            if path in self.failing:
+                return self.failing[path], b'', {}
+            if self.faults.get(path):
+                return self.faults[path].pop(0), b'', {}
+            if path not in self.bodies:
+                return 404, b'', {}
+            if self.cookie is None:
+                return (403 if self.cookie_version else 401), b'', {}
+            sent = SimpleCookie(cookie or '').get('nsit')
+            if sent is None or sent.value != self.cookie:
+                return 401, b'', {}
+            bodies = self.bodies[path]
+            body = bodies[min(self.served[path], len(bodies) - 1)]
+            self.served[path] += 1
+            return 200, body, {}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body, headers = server._respond(self.path, self.headers.get('Cookie'))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                # Bodies go out exactly as recorded, still compressed
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True, name='replay-server')
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def replay(records, speed=None, holdings=None, render=True, metrics=None, on_tick=None):
+    # Runs every recorded tick through fetch, pricing, publishing and, with
+    # render, the page views and charts. speed=1 keeps the recorded pacing,
+    # None runs flat out. holdings defaults to the configured holdings file.
+    # Returns the IngestionService used.
+    fetcher = ReplayFetcher(records)
+    holdings = load_holdings() if holdings is None else holdings
+    # Alerts are evaluated as live but not written to the alert log. The
+    # master debt cache lives in a temporary directory kept until the last
+    # tick has run, since a day rollover rewrites it.
+    with tempfile.TemporaryDirectory() as cache_dir:
+        service = IngestionService(fetcher, fetcher.urls, master_cache=os.path.join(cache_dir, 'master_debt.arrow'),
+                                   clock=lambda: datetime.fromtimestamp(fetcher.now), metrics=metrics, metrics_path=None,
+                                   alerts=AlertEngine(load_rules(), holdings, log_path=None))
+        metrics = service.metrics
+        view_cache = ViewCache(holdings)
+        market_charts = MarketCharts() if render else None
+        started = time.perf_counter()
+        first_ts = fetcher.ticks[0][0] if fetcher.ticks else 0
+        try:
+            for position, (ts, _) in enumerate(fetcher.ticks):
+                fetcher.position = position
+                if speed:
+                    delay = (ts - first_ts) / speed - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+                with metrics.stage('tick'):
+                    data = service.fetch_update()
+                    snapshot = service.publish(data) if data is not None else None
+                    if snapshot is not None and render:
+                        with metrics.stage('views'):
+                            for page in TABLE_PAGES:
+                                # The Arrow conversion st.dataframe does per session
+                                pa.Table.from_pandas(view_cache.get(page, snapshot).frame)
+                        with metrics.stage('charts'):
+                            market_charts.render(snapshot)
+                if on_tick is not None:
+                    on_tick(position, snapshot)
+        finally:
+            if market_charts is not None:
+                market_charts.close()
+            # A background master refresh also writes the cache
+            if service.refresh_thread is not None:
+                service.refresh_thread.join()
+    return service
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a recorded session through the pipeline')
+    parser.add_argument('directory', help='recording made with DEBTVIEW_RECORD_DIR')
+    parser.add_argument('--speed', type=float, default=None, help='1 for real time; default is as fast as possible')
+    parser.add_argument('--no-render', action='store_true', help='skip page views and charts')
+    args = parser.parse_args()
+
+    def report(position, snapshot):
+        if snapshot is not None:
+            print(f"tick {position}: version {snapshot.version}, {len(snapshot.changed)} symbols changed")
+
+    replay(load_recording(args.directory), speed=args.speed, render=not args.no_render, on_tick=report)
+
+
+if __name__ == '__main__':
+    main()
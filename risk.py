@@ -0,0 +1,176 @@
+import os
+import numpy as np
+import pandas as pd
+from bondmath import days360_us, parse_dates
+
+# Risk analytics
+#
+# Coupon bonds get a cash flow grid per symbol from the master_debt coupon
+# schedule: the remaining coupons fall every six months from the next coupon
+# date to redemption, at times (in half years) t0, t0 + 1, ... where t0 is
+# the 30/360 time to the next coupon. Discounting the grid at the semi-annual
+# bid, ask and VWAP yields of every depth row in one array operation gives
+# the dirty price and from it Macaulay and modified duration (years),
+# convexity (years squared) and PV01 (price change per 100 face for a one
+# basis point move). Zero coupon bonds and T-bills use the money market
+# yield they are quoted on.
+#
+# Holdings (symbol -> face value) come from HOLDINGS_PATH and are used for
+# the Selling page and its position-weighted totals. The shipped file only
+# lists the bonds the Selling page tracks, with no Face values: positions
+# are not configured until they are filled in, and until then the page shows
+# per bond risk without market values or totals.
+HOLDINGS_PATH = os.environ.get("DEBTVIEW_HOLDINGS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "holdings.csv"))
+# column prefix -> yield the measures are taken at
+RISK_SIDES = {"bid": "bidyield", "ask": "askyield", "avg": "avgyield"}
+RISK_MEASURES = ["macaulay", "duration", "convexity", "pv01"]
+RISK_COLUMNS = [side + measure for side in RISK_SIDES for measure in RISK_MEASURES]
+
+
+def cash_flow_grid(master_debt):
+    # Per symbol (times, flows) arrays of shape (bonds, most coupons left),
+    # padded with zero flows, plus the symbols in row order
+    coupon = master_debt[" IP RATE"].to_numpy(dtype=float)
+    redemption = parse_dates(master_debt[" REDEMPTION DATE"], "%d-%b-%Y")
+    next_coupon = parse_dates(master_debt["next coupon date"], "%d-%b-%Y")
+    settlement = np.datetime64(master_debt["settlement date"].iat[0], 'D') if len(master_debt) else np.datetime64('NaT')
+
+    bearing = (coupon != 0) & ~np.isnat(next_coupon)
+    next_coupon = np.where(bearing, next_coupon, redemption)
+    months = redemption.astype('datetime64[M]').astype(np.int64) - next_coupon.astype('datetime64[M]').astype(np.int64)
+    remaining = np.where(bearing, months // 6 + 1, 0)
+    first = days360_us(settlement, next_coupon) / 180
+
+    periods = np.arange(max(int(remaining.max(initial=0)), 1))
+    times = first[:, None] + periods
+    live = periods < remaining[:, None]
+    flows = np.where(live, coupon[:, None] / 2, 0.0)
+    flows[np.arange(len(coupon)), np.maximum(remaining - 1, 0)] += np.where(bearing, 100, 0)
+    return master_debt["Symbol"].to_numpy(), np.where(live, times, 0.0), flows
+
+
+def grid_risk(times, flows, yields):
+    # times/flows (rows, periods), yields (rows, sides) as decimals. Returns
+    # (rows, sides, measure) with measures in RISK_MEASURES order.
+    r = yields[..., None] / 2
+    with np.errstate(invalid='ignore', divide='ignore', over='ignore'):
+        discounted = flows[:, None, :] * (1 + r) ** -times[:, None, :]
+        price = discounted.sum(axis=-1)
+        macaulay = (discounted * times[:, None, :]).sum(axis=-1) / price / 2
+        modified = macaulay / (1 + r[..., 0])
+        convexity = (discounted * times[:, None, :] * (times[:, None, :] + 1)).sum(axis=-1) / price / (1 + r[..., 0]) ** 2 / 4
+    return np.stack([macaulay, modified, convexity, modified * price * 1e-4], axis=-1)
+
+
+def money_market_risk(days, yields):
+    # Simple interest to maturity: P = 100 / (1 + y * days / 365)
+    years = days[:, None] / 365
+    with np.errstate(invalid='ignore', divide='ignore'):
+        growth = 1 + yields * years
+        price = 100 / growth
+        modified = years / growth
+    return np.stack([np.broadcast_to(years, yields.shape), modified, 2 * modified ** 2, modified * price * 1e-4], axis=-1)
+
+
+def row_keys(symbols):
+    # (Symbol, depth level) for every row
+    symbols = pd.Series(symbols)
+    return pd.MultiIndex.from_arrays([symbols.to_numpy(), symbols.groupby(symbols, sort=False).cumcount().to_numpy()])
+
+
+class RiskEngine:
+    # Adds RISK_COLUMNS to the priced table. The cash flow grid is rebuilt
+    # only when master_debt changes (settlement roll or refresh); after that
+    # update() recomputes only the rows of changed symbols and carries the
+    # rest over from the previous snapshot by (Symbol, level).
+    def __init__(self):
+        self.master_debt = None
+        self.grid = None
+        self.symbols = None
+        self.risk = None
+
+    def _grid(self, master_debt):
+        if master_debt is not self.master_debt:
+            symbols, times, flows = cash_flow_grid(master_debt)
+            self.grid = (pd.Index(symbols), times, flows,
+                         master_debt[" IP RATE"].to_numpy(dtype=float), master_debt["days to maturity"].to_numpy(dtype=float))
+            self.master_debt = master_debt
+        return self.grid
+
+    def compute(self, symbols, yields, master_debt):
+        # (rows, sides, measures) for row symbols and percent yields (rows, sides)
+        known, times, flows, coupon, days = self._grid(master_debt)
+        bonds = known.get_indexer(symbols)
+        found = bonds >= 0
+        yields = np.where(yields > 0, yields / 100, np.nan)
+        risk = np.full(yields.shape + (len(RISK_MEASURES),), np.nan)
+        bearing = found & (coupon[bonds] != 0)
+        money = found & (coupon[bonds] == 0)
+        if bearing.any():
+            rows = bonds[bearing]
+            risk[bearing] = grid_risk(times[rows], flows[rows], yields[bearing])
+        if money.any():
+            risk[money] = money_market_risk(days[bonds[money]], yields[money])
+        return risk
+
+    def update(self, data, master_debt, changed=None):
+        symbols = data["Symbol"].to_numpy()
+        yields = data[list(RISK_SIDES.values())].to_numpy(dtype=float)
+        if self.symbols is None or master_debt is not self.master_debt or changed is None:
+            risk = self.compute(symbols, yields, master_debt)
+        else:
+            if np.array_equal(symbols, self.symbols):
+                # Same rows in the same order, the usual case
+                previous = np.arange(len(symbols))
+            else:
+                previous = row_keys(self.symbols).get_indexer(row_keys(symbols))
+            stale = (previous < 0) | np.isin(symbols, list(changed))
+            risk = np.empty((len(data), len(RISK_SIDES), len(RISK_MEASURES)))
+            risk[~stale] = self.risk[previous[~stale]]
+            if stale.any():
+                risk[stale] = self.compute(symbols[stale], yields[stale], master_debt)
+        self.symbols = symbols
+        self.risk = risk
+        return data.assign(**dict(zip(RISK_COLUMNS, risk.reshape(len(data), -1).T)))
+
+
+def load_holdings(path=HOLDINGS_PATH):
+    # Symbol -> face value held, from a CSV with Symbol and Face columns;
+    # NaN where the Face is blank (position not configured)
+    try:
+        holdings = pd.read_csv(path, dtype={"Symbol": str, "Face": float})
+    except FileNotFoundError:
+        print(f"No holdings file at {path}")
+        return pd.Series(dtype=float, name="Face")
+    return holdings.groupby("Symbol")["Face"].sum(min_count=1)
+
+
+def position_risk(data, holdings):
+    # One row per holding at its best bid (what selling would fetch), plus a
+    # total row with market value weighted durations and convexity. The best
+    # bid is the highest bidprice among depth rows with a bid quantity;
+    # holdings without one have no market value or risk, are marked in the
+    # No bid column and are left out of the totals, which count them instead.
+    # Holdings without a face value have the per bond measures only and
+    # leave the totals NaN when none has one.
+    bids = data[data["Symbol"].isin(holdings.index) & (data["bidquantity"] != 0) & (data["bidprice"] > 0)]
+    best = bids.sort_values("bidprice", ascending=False, kind="stable").drop_duplicates("Symbol").set_index("Symbol")
+    best = best.reindex(holdings.index)
+    face = holdings.astype(float)
+    unbid = best["bidprice"].isna()
+    positions = pd.DataFrame({
+        "Face": face,
+        "Market Value": face / 100 * best["bidprice"],
+        "Macaulay": best["bidmacaulay"],
+        "Duration": best["bidduration"],
+        "Convexity": best["bidconvexity"],
+        "PV01": face / 100 * best["bidpv01"],
+        "No bid": unbid.astype(int),
+    })
+    weights = positions["Market Value"].where(positions["Duration"].notna(), 0)
+    total = {"Face": face[~unbid].sum(min_count=1), "Market Value": positions["Market Value"].sum(min_count=1),
+             "PV01": positions["PV01"].sum(min_count=1), "No bid": int(unbid.sum())}
+    for column in ("Macaulay", "Duration", "Convexity"):
+        total[column] = (positions[column] * weights).sum() / weights.sum() if weights.sum() else np.nan
+    positions.loc["Total"] = pd.Series(total)
+    return positions.astype({"No bid": int})
@@ -0,0 +1,219 @@
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+import pandas as pd
+from alerts import AlertEngine, load_rules
+from bondmath import settlement_date_for
+from curves import CurveFitter
+from feed import DepthParser, decode_body, load_entries
+from metrics import METRICS_PATH, Metrics, write_json
+from pipeline import IncrementalPricer
+from refdata import CACHE_PATH, DEBT_URL, ensure_settlement, load_master_debt, refresh_master_debt
+from risk import RiskEngine, load_holdings
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    # data and curves are shared by every session and must be treated as
+    # read-only. curves maps (series, side, model) to a fitted curve; alerts
+    # are the most recent alerts.Alert, oldest first.
+    version: int
+    data: pd.DataFrame
+    changed: frozenset = frozenset()
+    published_at: float = field(default_factory=time.time)
+    curves: dict = field(default_factory=dict)
+    alerts: tuple = ()
+
+
+class SnapshotBus:
+    # Latest snapshot plus a condition variable so readers can block until a
+    # newer version is published
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.snapshot = Snapshot(0, pd.DataFrame(), frozenset(), 0.0)
+
+    def publish(self, data, changed=frozenset(), curves=None, alerts=()):
+        with self.condition:
+            self.snapshot = Snapshot(self.snapshot.version + 1, data, frozenset(changed), curves=dict(curves or {}),
+                                     alerts=tuple(alerts))
+            self.condition.notify_all()
+            return self.snapshot
+
+    def latest(self):
+        return self.snapshot
+
+    def wait_for(self, version, timeout=None):
+        # Returns the first snapshot newer than version, or the current one
+        # if the timeout runs out first
+        with self.condition:
+            self.condition.wait_for(lambda: self.snapshot.version > version, timeout)
+            return self.snapshot
+
+
+class IngestionService:
+    # The single poller of a process: fetches, prices and publishes one
+    # snapshot per cycle onto bus for every session to read. Stage timings
+    # and counters go to metrics; diagnostics() is written to metrics_path
+    # after every cycle unless it is None. bus and pricer can be swapped for
+    # the shared memory bus and a sharded pricer (see worker.py). alerts is
+    # the AlertEngine run on every published snapshot, by default with the
+    # configured rules and holdings.
+    def __init__(self, fetcher, live_urls, interval=5, history=None, master_cache=CACHE_PATH, clock=datetime.today,
+                 metrics=None, metrics_path=METRICS_PATH, stale_after=None, bus=None, pricer=None, alerts=None):
+        self.fetcher = fetcher
+        self.live_urls = live_urls
+        self.interval = interval
+        self.history = history
+        self.master_cache = master_cache
+        self.clock = clock
+        self.metrics = metrics or Metrics()
+        self.metrics_path = metrics_path
+        # Feed data older than this is flagged stale
+        self.stale_after = stale_after or 3 * interval
+        self.bus = bus or SnapshotBus()
+        self.depth_parser = DepthParser()
+        self.pricer = pricer or IncrementalPricer()
+        self.curve_fitter = CurveFitter()
+        self.risk_engine = RiskEngine()
+        self.alert_engine = alerts or AlertEngine(load_rules(), load_holdings())
+        self.thread = None
+
+        # Reference data comes from the on-disk cache when there is one;
+        # DEBT.csv is only downloaded up front on the very first start, or
+        # when recording, since replay.py needs it in the recording
+        self.refresh_thread = None
+        self.day = None
+        self.master_downloads = 0
+        self.roll_over()
+
+    def download_master_debt(self):
+        self.master_downloads += 1
+        return decode_body(self.fetcher.get(DEBT_URL))
+
+    def refresh_master_debt(self):
+        try:
+            master_debt = refresh_master_debt(self.download_master_debt, self.settlement_date, self.master_cache, self.day)
+            self.master_debt = ensure_settlement(master_debt, self.settlement_date)
+        except Exception as e:
+            print(f"Master debt refresh failed, keeping cached copy: {e}")
+
+    def roll_over(self):
+        # Once a day: roll accrued interest and tenors to the new settlement
+        # date (persisted to the cache) and, when the cached DEBT.csv is from
+        # an earlier day, refetch it in the background so new issues appear
+        # without a restart
+        first = self.day is None
+        self.day = self.clock().date()
+        self.settlement_date = settlement_date_for(self.clock()).strftime('%Y-%m-%d')
+        try:
+            self.master_debt, stale = load_master_debt(self.download_master_debt, self.settlement_date, self.master_cache, self.day)
+        except Exception as e:
+            if first:
+                raise
+            print(f"Reloading master debt failed, rolling the copy in memory: {e}")
+            self.master_debt, stale = ensure_settlement(self.master_debt, self.settlement_date), True
+        if first and not self.master_downloads and getattr(self.fetcher, 'recorder', None) is not None:
+            # A warm cache never fetches DEBT.csv, so fetch it once through
+            # the recording fetcher; this also refreshes the cache
+            self.refresh_master_debt()
+            stale = False
+        if stale and not (self.refresh_thread and self.refresh_thread.is_alive()):
+            self.refresh_thread = threading.Thread(target=self.refresh_master_debt, daemon=True, name='master-debt-refresh')
+            self.refresh_thread.start()
+
+    def fetch_update(self):
+        if self.clock().date() != self.day:
+            self.roll_over()
+        self.metrics.count('cycles')
+        with self.metrics.stage('fetch'):
+            bodies = self.fetcher.poll(self.live_urls)
+        if not bodies:
+            # Nothing fetched yet and nothing to fall back on
+            return None
+        return self.process(bodies)
+
+    def process(self, bodies):
+        # Raw endpoint bodies to the published table
+        with self.metrics.stage('decode'):
+            payloads = [load_entries(body) for body in bodies.values()]
+        with self.metrics.stage('parse'):
+            bid_ask = pd.concat([self.depth_parser.parse_entries(entries) for entries in payloads], ignore_index=True)
+
+        # Only symbols whose depth changed since the last poll are repriced
+        with self.metrics.stage('price'):
+            final_yield = self.pricer.update(bid_ask, self.master_debt)
+            final_yield['bidprice'] = final_yield['bidprice'].round(2)
+            final_yield['askprice'] = final_yield['askprice'].round(2)
+            final_yield['VWATP'] = final_yield['VWATP'].round(2)
+        with self.metrics.stage('risk'):
+            final_yield = self.risk_engine.update(final_yield, self.master_debt, self.pricer.changed)
+        # Curves are refitted only when some symbol was repriced
+        with self.metrics.stage('curves'):
+            final_yield = self.curve_fitter.update(final_yield, self.pricer.changed)
+        self.metrics.gauge('rows', len(final_yield))
+        self.metrics.gauge('changed symbols', len(self.pricer.changed))
+        return final_yield
+
+    def publish(self, data):
+        # A quiet book republishes nothing, so sessions stay idle
+        if not (self.pricer.changed or self.bus.latest().version == 0):
+            self.metrics.count('quiet cycles')
+            return None
+        with self.metrics.stage('alerts'):
+            fired = self.alert_engine.update(data, self.clock().timestamp())
+        if fired:
+            self.metrics.count('alerts', len(fired))
+        snapshot = self.bus.publish(data, self.pricer.changed, self.curve_fitter.curves, self.alert_engine.recent)
+        self.metrics.count('published')
+        if self.history is not None:
+            try:
+                with self.metrics.stage('history'):
+                    self.history.append(snapshot.data, snapshot.changed, snapshot.published_at)
+            except Exception as e:
+                self.metrics.count('history errors')
+                print(f"History append failed: {e}")
+        return snapshot
+
+    def diagnostics(self, now=None):
+        # Snapshot and feed freshness, stage timings, counters and per URL
+        # HTTP stats, as plain JSON-able values
+        now = time.time() if now is None else now
+        snapshot = self.bus.latest()
+        fresh = [self.fetcher.fresh_at.get(url) for url in self.live_urls]
+        data_age = now - min(fresh) if fresh and None not in fresh else None
+        with self.fetcher.stats_lock:
+            http = {url: dict(stats, status={str(k): v for k, v in stats['status'].items()})
+                    for url, stats in self.fetcher.stats.items()}
+        return {
+            'time': now,
+            'snapshot_version': snapshot.version,
+            'snapshot_age_seconds': now - snapshot.published_at if snapshot.version else None,
+            'data_age_seconds': data_age,
+            'stale': data_age is None or data_age > self.stale_after,
+            **self.metrics.summary(),
+            'http': http,
+        }
+
+    def run(self):
+        while True:
+            try:
+                data = self.fetch_update()
+            except Exception as e:
+                self.metrics.count('update errors')
+                print(f"Update failed: {e}")
+                data = None
+            if data is not None:
+                self.publish(data)
+            if self.metrics_path:
+                try:
+                    write_json(self.diagnostics(), self.metrics_path)
+                except OSError as e:
+                    print(f"Writing metrics failed: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True, name='ingestion')
+            self.thread.start()
+        return self
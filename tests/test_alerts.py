@@ -0,0 +1,62 @@
+import pandas as pd
+import pytest
+from alerts import AlertEngine, compile_condition
+
+
+def snapshot(**columns):
+    # One best level row per symbol; Series defaults to GS
+    frame = pd.DataFrame(columns)
+    frame["Series"] = columns.get("Series", "GS")
+    return frame
+
+
+def fired(engine, data, now):
+    return [(alert.rule, alert.symbol) for alert in engine.update(data, now)]
+
+
+@pytest.mark.parametrize("condition", ["bidyield > limit", "bidyield.real > 7", "bidyield > 'GS'", "abs(bidyield) > 1",
+                                       "bidyield", "bidyield + 1", "bidyield > 7 if held else False", "bidyield >"])
+def test_unsupported_conditions_are_rejected_and_their_rules_skipped(condition):
+    with pytest.raises((SyntaxError, ValueError)):
+        compile_condition(condition, "_w", lambda value: 0)
+    engine = AlertEngine([{"name": "bad", "when": condition}, {"name": "good", "when": "bidyield > 7"}], log_path=None)
+    assert [rule["name"] for group in engine.groups for rule in group.rules] == ["good"]
+
+
+def test_clear_condition_rearms_a_rule():
+    engine = AlertEngine([{"name": "high", "when": "bidyield > 7.10", "clear": "bidyield < 7.08"}], log_path=None)
+    yields = [7.11, 7.09, 7.12, 7.07, 7.11]
+    hits = [fired(engine, snapshot(Symbol=["A"], bidyield=[y]), now) for now, y in enumerate(yields)]
+    assert hits == [[("high", "A")], [], [], [], [("high", "A")]]
+
+
+def test_cooldown_holds_back_a_refire():
+    engine = AlertEngine([{"name": "high", "when": "bidyield > 7.10", "cooldown": 60}], log_path=None)
+    ticks = [(0, 7.11), (10, 7.00), (20, 7.11), (50, 7.11), (70, 7.11), (80, 7.11)]
+    hits = [fired(engine, snapshot(Symbol=["A"], bidyield=[y]), now) for now, y in ticks]
+    assert hits == [[("high", "A")], [], [], [], [("high", "A")], []]
+
+
+def test_rule_state_follows_symbols_that_reorder_or_disappear():
+    engine = AlertEngine([{"name": "high", "when": "bidyield > 7.10"}], log_path=None)
+    assert fired(engine, snapshot(Symbol=["A", "B"], bidyield=[7.11, 7.00]), 0) == [("high", "A")]
+    # A stays above while B crosses, in the other order
+    assert fired(engine, snapshot(Symbol=["B", "A"], bidyield=[7.12, 7.11]), 1) == [("high", "B")]
+    # A drops out of the feed and comes back still above: no refire
+    assert fired(engine, snapshot(Symbol=["B"], bidyield=[7.12]), 2) == []
+    assert fired(engine, snapshot(Symbol=["C", "A", "B"], bidyield=[7.00, 7.11, 7.00]), 3) == []
+    assert fired(engine, snapshot(Symbol=["A", "B"], bidyield=[7.11, 7.11]), 4) == [("high", "B")]
+
+
+def test_volume_spike_is_measured_against_earlier_snapshots():
+    engine = AlertEngine([{"name": "spike", "when": "volume_delta > 5 * volume_avg and volume_delta > 0"}],
+                         log_path=None)
+    volumes = [100, 110, 120, 180, 190, 1000]
+    hits = [fired(engine, snapshot(Symbol=["A"], Volume=[v]), now) for now, v in enumerate(volumes)]
+    # No baseline for the first delta; the 60 lot spike fires against the
+    # two deltas before it, and does not lift its own baseline: 810 lots is
+    # more than 5 times the 22.5 lot average of 10, 10, 60 and 10
+    assert hits == [[], [], [], [("spike", "A")], [], [("spike", "A")]]
+    # A session restart (volume drops) starts a new baseline
+    assert fired(engine, snapshot(Symbol=["A"], Volume=[5]), 6) == []
+    assert fired(engine, snapshot(Symbol=["A"], Volume=[50]), 7) == []
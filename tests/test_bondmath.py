@@ -0,0 +1,44 @@
+import numpy as np
+import numpy_financial as npf
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+from days360 import days360
+from bondmath import YIELD_MATCH_TOL, batch_yields, coupon_dates, days360_us
+
+
+def test_batch_yields_match_npf_rate():
+    rng = np.random.default_rng(1)
+    rows = 2000
+    coupon = np.round(rng.uniform(4, 10, rows), 2)
+    nper = rng.uniform(0.1, 40, rows)
+    clean = rng.uniform(70, 130, rows)
+    yields, converged = batch_yields(coupon, nper, nper * 365, clean[:, None], clean[:, None])
+    expected = npf.rate(nper * 2, coupon / 2, -clean, 100) * 2
+    assert converged.all()
+    assert np.abs(yields[:, 0] - expected).max() < YIELD_MATCH_TOL
+
+
+def reference_schedule(redemption, settlement):
+    # The original per-row loop
+    last = redemption
+    while last > settlement:
+        last -= relativedelta(months=6)
+    return last, last + relativedelta(months=6), days360(last, settlement, method="US")
+
+
+def test_coupon_dates_and_day_count_match_relativedelta_and_days360():
+    rng = np.random.default_rng(2)
+    days = rng.integers(0, 365 * 30, 3000)
+    redemption = np.datetime64('2026-01-01') + days
+    # Month ends, including leap and non-leap Februaries
+    ends = (np.datetime64('2026-01', 'M') + rng.integers(0, 12 * 30, 3000) + 1).astype('datetime64[D]') - 1
+    redemption = np.concatenate([redemption, ends])
+    settlement = np.datetime64('2025-06-01') + rng.integers(0, 365 * 4, redemption.size)
+    settlement = np.minimum(settlement, redemption - 1)
+
+    last, next_ = coupon_dates(redemption, settlement)
+    days_between = days360_us(last, settlement)
+    for i in range(redemption.size):
+        expected = reference_schedule(pd.Timestamp(redemption[i]).to_pydatetime(), pd.Timestamp(settlement[i]).to_pydatetime())
+        actual = (pd.Timestamp(last[i]).to_pydatetime(), pd.Timestamp(next_[i]).to_pydatetime(), days_between[i])
+        assert actual == expected, (redemption[i], settlement[i])
@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from curves import (NS_MIN_POINTS, NSS_MIN_POINTS, PLAUSIBLE_BAND, TAU_BOUNDS, NelsonSiegelSvensson,
+                    SmoothingSpline, robust_fit)
+
+
+def noisy_curve(rng, points):
+    t = np.sort(rng.uniform(0.3, 35, points))
+    return t, 7.2 - 0.8 * np.exp(-t / 2) + rng.normal(0, 0.35, points)
+
+
+@pytest.mark.parametrize("model", [NelsonSiegelSvensson, SmoothingSpline])
+def test_fits_stay_near_the_observed_yields(model):
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        t, y = noisy_curve(rng, int(rng.integers(NS_MIN_POINTS, 2 * NSS_MIN_POINTS)))
+        curve = robust_fit(model, t, y)
+        fitted = curve(np.linspace(t.min(), t.max(), 200))
+        assert y.min() - PLAUSIBLE_BAND <= fitted.min() and fitted.max() <= y.max() + PLAUSIBLE_BAND
+
+
+def test_nss_drops_the_second_hump_or_the_curve_with_few_points():
+    rng = np.random.default_rng(1)
+    t, y = noisy_curve(rng, NS_MIN_POINTS - 1)
+    assert robust_fit(NelsonSiegelSvensson, t, y) is None
+    t, y = noisy_curve(rng, NSS_MIN_POINTS - 1)
+    assert robust_fit(NelsonSiegelSvensson, t, y).betas[3] == 0
+    t, y = noisy_curve(rng, 2 * NSS_MIN_POINTS)
+    assert robust_fit(NelsonSiegelSvensson, t, y).betas[3] != 0
+
+
+def test_nss_keeps_positive_rates_and_bounded_decay_times():
+    rng = np.random.default_rng(2)
+    for _ in range(100):
+        t, y = noisy_curve(rng, int(rng.integers(NS_MIN_POINTS, 2 * NSS_MIN_POINTS)))
+        curve = robust_fit(NelsonSiegelSvensson, t, y)
+        beta0, beta1 = curve.betas[:2]
+        assert beta0 > 0 and beta0 + beta1 > 0
+        assert all(TAU_BOUNDS[0] <= tau <= TAU_BOUNDS[1] for tau in curve.taus)
+        # Warm started from itself on new noise, the fit stays plausible
+        t, y = noisy_curve(rng, len(t))
+        assert robust_fit(NelsonSiegelSvensson, t, y, curve).betas[0] > 0
@@ -0,0 +1,94 @@
+import gzip
+import json
+import zlib
+import brotli
+import pytest
+import zstandard as zstd
+from feed import FetchError, Fetcher, decode_body, load_entries
+from replay import Record, ReplayServer
+
+GSEC_URL = "https://www.nseindia.com/api/liveBonds-traded-on-cm?type=gsec"
+BONDS_URL = "https://www.nseindia.com/api/liveBonds-traded-on-cm?type=bonds"
+
+
+def body(symbol, price):
+    return brotli.compress(json.dumps({"data": [{"symbol": symbol, "averagePrice": price}]}).encode())
+
+
+def raw_deflate(content):
+    compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+    return compressor.compress(content) + compressor.flush()
+
+
+@pytest.mark.parametrize("encode", [lambda content: content, gzip.compress, zlib.compress, raw_deflate, brotli.compress,
+                                    zstd.ZstdCompressor().compress],
+                         ids=["identity", "gzip", "deflate", "raw deflate", "br", "zstd"])
+def test_decode_body_handles_every_accepted_encoding(encode):
+    content = json.dumps({"data": [{"symbol": "718GS2033", "averagePrice": 101.0}] * 20}).encode()
+    assert decode_body(encode(content)) == content.decode()
+
+
+def test_decode_body_rejects_undecodable_bytes():
+    with pytest.raises(ValueError):
+        decode_body(bytes(range(256)))
+
+
+@pytest.fixture
+def server():
+    records = [Record(1, GSEC_URL, body("718GS2033", 101.0)), Record(2, BONDS_URL, body("763SG2031", 100.2)),
+               Record(6, GSEC_URL, body("718GS2033", 101.5)), Record(7, BONDS_URL, body("763SG2031", 100.4))]
+    with ReplayServer(records) as server:
+        yield server
+
+
+@pytest.fixture
+def fetcher(server):
+    return Fetcher(server.base_url, {}, retries=2, backoff=0)
+
+
+def price(content):
+    return load_entries(content)[0]["averagePrice"]
+
+
+def test_rejected_cookie_is_refreshed_and_retried(server, fetcher):
+    url = server.url(GSEC_URL)
+    server.faults[server.path(GSEC_URL)] = [403]
+    assert price(fetcher.get(url)) == 101.0
+    # The 403 dropped the cookies, so the home page was fetched again
+    assert server.requests["/"] == 2
+    assert fetcher.stats[url]["status"] == {403: 1, 200: 1}
+
+
+def test_expired_cookie_is_refreshed(server, fetcher):
+    url = server.url(GSEC_URL)
+    fetcher.get(url)
+    server.expire_cookies()
+    assert price(fetcher.get(url)) == 101.5
+    assert server.requests["/"] == 2
+    assert fetcher.stats[url]["status"] == {200: 2, 403: 1}
+
+
+def test_failing_endpoint_falls_back_to_last_good_body(server, fetcher):
+    gsec, bonds = server.url(GSEC_URL), server.url(BONDS_URL)
+    first = fetcher.poll([gsec, bonds])
+    fresh_at = fetcher.fresh_at[gsec]
+
+    server.fail(server.path(GSEC_URL), 500)
+    second = fetcher.poll([gsec, bonds])
+    assert second[gsec] == first[gsec]
+    assert price(second[bonds]) == 100.4
+    assert fetcher.stats[gsec]["fallbacks"] == 1
+    assert fetcher.stats[gsec]["status"][500] == 3
+    assert fetcher.fresh_at[gsec] == fresh_at
+
+    server.recover(server.path(GSEC_URL))
+    assert price(fetcher.poll([gsec, bonds])[gsec]) == 101.5
+    assert fetcher.fresh_at[gsec] > fresh_at
+
+
+def test_endpoint_without_a_good_body_is_left_out(server, fetcher):
+    gsec, bonds = server.url(GSEC_URL), server.url(BONDS_URL)
+    server.fail(server.path(BONDS_URL), 500)
+    assert list(fetcher.poll([gsec, bonds])) == [gsec]
+    with pytest.raises(FetchError):
+        fetcher.get(bonds)
@@ -0,0 +1,105 @@
+import os
+from datetime import date, datetime, time, timedelta
+import numpy as np
+import pandas as pd
+from history import RECORD, TickHistory
+
+TODAY = date.today()
+
+
+def at(day, second):
+    return datetime.combine(day, time(10)).timestamp() + second
+
+
+def book(symbols, price, levels=2):
+    # levels depth rows per symbol, bid prices stepping down from price
+    rows = [(symbol, price - 0.1 * level) for symbol in symbols for level in range(levels)]
+    frame = pd.DataFrame(rows, columns=["Symbol", "bidprice"])
+    frame["askprice"] = frame["bidprice"] + 0.2
+    for column in ("VWATP", "bidyield", "askyield", "avgyield"):
+        frame[column] = 7.0
+    frame["bidquantity"] = 10
+    frame["askquantity"] = 5
+    frame["Volume"] = 100
+    return frame
+
+
+def fill(history, ticks, symbols=("718GS2033", "726GS2032")):
+    for tick in range(ticks):
+        history.append(book(symbols, 100 + tick), list(symbols), at(TODAY, tick))
+
+
+def test_restart_rebuilds_symbols_index_and_ring(tmp_path):
+    history = TickHistory(str(tmp_path), ring_size=8, initial_rows=16)
+    fill(history, 5)
+    expected = history.query("718GS2033")
+    history.close()
+
+    reopened = TickHistory(str(tmp_path), ring_size=8, initial_rows=16)
+    assert reopened.symbols == ["718GS2033", "726GS2032"]
+    assert reopened.rows == 20
+    pd.testing.assert_frame_equal(reopened.query("718GS2033"), expected)
+    # The ring holds the newest rows again and appends carry on after them
+    assert (reopened.ring['ts'] == at(TODAY, 4)).sum() == 4
+    reopened.append(book(["763SG2031"], 99), ["763SG2031"], at(TODAY, 5))
+    assert reopened.rows == 22
+    assert list(reopened.query("763SG2031", level=0)["bidprice"]) == [99]
+
+
+def test_old_rows_are_read_from_the_log_and_recent_ones_from_the_ring(tmp_path):
+    history = TickHistory(str(tmp_path), ring_size=4, initial_rows=64)
+    fill(history, 6)
+    # Only the last tick (4 rows) is still in the ring
+    recent = history.query("718GS2033", start=at(TODAY, 5))
+    assert np.allclose(recent["bidprice"], [105.0, 104.9])
+    full = history.query("718GS2033", level=0)
+    assert list(full["bidprice"]) == [100, 101, 102, 103, 104, 105]
+    middle = history.query("726GS2032", start=at(TODAY, 2), end=at(TODAY, 4), level=1)
+    assert np.allclose(middle["bidprice"], [101.9, 102.9])
+    # Ring reads do not touch the log: clobbering the log leaves them intact
+    history.log['bidprice'][:] = 0
+    assert np.allclose(history.query("718GS2033", start=at(TODAY, 5))["bidprice"], [105.0, 104.9])
+    assert (history.query("718GS2033")["bidprice"] == 0).all()
+
+
+def test_log_grows_by_remapping(tmp_path):
+    history = TickHistory(str(tmp_path), ring_size=4, initial_rows=4)
+    fill(history, 3)
+    assert history.rows == 12
+    # Doubled twice from 4 rows, each time remapping the grown file
+    assert history.capacity == 16
+    assert os.path.getsize(history.log_path) == history.capacity * RECORD.itemsize
+    assert list(history.query("726GS2032", level=0)["bidprice"]) == [100, 101, 102]
+    history.close()
+    reopened = TickHistory(str(tmp_path), ring_size=4, initial_rows=4)
+    assert reopened.rows == 12
+    assert list(reopened.query("726GS2032", level=0)["bidprice"]) == [100, 101, 102]
+
+
+def test_day_rollover_compacts_the_log_and_expires_old_days(tmp_path):
+    for days in (3, 6):
+        old = TODAY - timedelta(days=days)
+        for suffix in (".ticks", ".json"):
+            (tmp_path / f"{old.isoformat()}{suffix}").write_text("")
+    history = TickHistory(str(tmp_path), ring_size=8, initial_rows=64, retention_days=5)
+    fill(history, 2)
+    today_log = history.log_path
+
+    tomorrow = TODAY + timedelta(days=1)
+    history.append(book(["763SG2031"], 99), ["763SG2031"], at(tomorrow, 0))
+    # Today's file is cut to its rows, tomorrow starts a fresh file and index
+    assert os.path.getsize(today_log) == 8 * RECORD.itemsize
+    assert history.day == tomorrow and history.rows == 2
+    assert history.symbols == ["763SG2031"]
+    assert history.query("718GS2033").empty
+    # Only days beyond the retention are removed
+    names = sorted(os.listdir(tmp_path))
+    assert f"{(TODAY - timedelta(days=6)).isoformat()}.ticks" not in names
+    assert f"{(TODAY - timedelta(days=3)).isoformat()}.ticks" in names
+    assert f"{TODAY.isoformat()}.json" in names
+
+    # The finished day still reads back from its compacted file
+    history.close()
+    reopened = TickHistory(str(tmp_path), ring_size=8, initial_rows=64, retention_days=5)
+    assert reopened.rows == 8
+    assert np.allclose(reopened.query("718GS2033", level=0)["bidprice"], [100, 101])
@@ -0,0 +1,84 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from feed import DepthParser
+from pipeline import IncrementalPricer, final_yields, price_depth
+from refdata import build_master_debt
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "DEBT.csv")
+SERIES = {"718GS2033": "GS", "726GS2032": "GS", "710GS2034": "GS", "763SG2031": "SG", "364D200327": "TB", "UNLISTED": "GS"}
+
+
+@pytest.fixture(scope="module")
+def master_debt():
+    with open(FIXTURE) as f:
+        return build_master_debt(f.read(), "2026-10-20")
+
+
+def entry(symbol, mid, volume=0, bids=5):
+    entry = {"symbol": symbol, "series": SERIES[symbol], "isinCode": "IN0000000000",
+             "totalTradedVolume": volume, "averagePrice": mid if volume else 0}
+    for i in range(1, 6):
+        entry[f"buyPrice{i}"] = round(mid - 0.05 * i, 2) if i <= bids else 0
+        entry[f"buyQuantity{i}"] = 10 * i if i <= bids else 0
+        entry[f"sellPrice{i}"] = round(mid + 0.05 * i, 2)
+        entry[f"sellQuantity{i}"] = 5 * i
+    return entry
+
+
+def reference(bid_ask, master_debt):
+    return final_yields(price_depth(bid_ask, master_debt))
+
+
+def check(pricer, parser, entries, master_debt):
+    bid_ask = parser.parse_entries(entries)
+    got = pricer.update(bid_ask, master_debt)
+    pd.testing.assert_frame_equal(got, reference(bid_ask, master_debt), check_dtype=False, rtol=1e-9)
+    return pricer.changed
+
+
+def test_matches_full_reprice_through_book_changes(master_debt):
+    pricer = IncrementalPricer()
+    parser = DepthParser()
+    book = {"718GS2033": 101.0, "726GS2032": 102.5, "710GS2034": 99.8, "763SG2031": 100.2, "364D200327": 96.0, "UNLISTED": 100.0}
+    entries = [entry(symbol, mid) for symbol, mid in book.items()]
+    assert check(pricer, parser, entries, master_debt) == set(book)
+
+    # Quiet poll
+    assert check(pricer, parser, entries, master_debt) == set()
+
+    # One price moves
+    entries[1] = entry("726GS2032", 102.6)
+    assert check(pricer, parser, entries, master_debt) == {"726GS2032"}
+
+    # A trade only changes volume and VWATP
+    entries[0] = entry("718GS2033", 101.0, volume=500)
+    assert check(pricer, parser, entries, master_debt) == {"718GS2033"}
+
+    # A symbol drops out, the rest reorder, a bid level disappears
+    entries = [entries[3], entries[0], entry("710GS2034", 99.8, bids=3), entries[4], entries[5]]
+    assert check(pricer, parser, entries, master_debt) == {"726GS2032", "710GS2034"}
+
+    # It comes back
+    entries.append(entry("726GS2032", 102.7))
+    assert check(pricer, parser, entries, master_debt) == {"726GS2032"}
+
+
+def test_new_master_reprices_everything(master_debt):
+    pricer = IncrementalPricer()
+    parser = DepthParser()
+    entries = [entry("718GS2033", 101.0), entry("763SG2031", 100.2)]
+    check(pricer, parser, entries, master_debt)
+    with open(FIXTURE) as f:
+        rolled = build_master_debt(f.read(), "2026-10-21")
+    assert check(pricer, parser, entries, rolled) == {"718GS2033", "763SG2031"}
+
+
+def test_result_is_not_shared_with_callers(master_debt):
+    pricer = IncrementalPricer()
+    entries = [entry("718GS2033", 101.0)]
+    first = pricer.update(DepthParser().parse_entries(entries), master_debt)
+    first["bidprice"] = np.nan
+    second = pricer.update(DepthParser().parse_entries(entries), master_debt)
+    assert second["bidprice"].notna().all()
@@ -0,0 +1,53 @@
+import os
+from datetime import date
+import pytest
+from refdata import load_master_debt, read_cache
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "DEBT.csv")
+
+
+@pytest.fixture
+def fetch_csv():
+    def fetch():
+        fetch.calls += 1
+        with open(FIXTURE) as f:
+            return f.read()
+    fetch.calls = 0
+    return fetch
+
+
+def test_cold_start_builds_and_caches(tmp_path, fetch_csv):
+    path = str(tmp_path / "master_debt.arrow")
+    master_debt, stale = load_master_debt(fetch_csv, "2026-10-19", path, today=date(2026, 10, 18))
+    assert fetch_csv.calls == 1
+    assert not stale
+    # Unparseable redemption dates are dropped, a blank coupon is a T-bill
+    assert list(master_debt["Symbol"]) == ["718GS2033", "726GS2032", "710GS2034", "763SG2031", "364D200327"]
+    assert master_debt.set_index("Symbol").at["364D200327", " IP RATE"] == 0
+    assert (master_debt["settlement date"] == "2026-10-19").all()
+    cached, source_date, settlement_date = read_cache(path)
+    assert (source_date, settlement_date) == ("2026-10-18", "2026-10-19")
+    assert cached.equals(master_debt)
+
+
+def test_warm_start_does_not_fetch(tmp_path, fetch_csv):
+    path = str(tmp_path / "master_debt.arrow")
+    first, _ = load_master_debt(fetch_csv, "2026-10-19", path, today=date(2026, 10, 18))
+    master_debt, stale = load_master_debt(fetch_csv, "2026-10-19", path, today=date(2026, 10, 18))
+    assert fetch_csv.calls == 1
+    assert not stale
+    assert master_debt.equals(first)
+
+
+def test_new_day_rolls_settlement_and_reports_stale(tmp_path, fetch_csv):
+    path = str(tmp_path / "master_debt.arrow")
+    first, _ = load_master_debt(fetch_csv, "2026-10-19", path, today=date(2026, 10, 18))
+    master_debt, stale = load_master_debt(fetch_csv, "2026-10-20", path, today=date(2026, 10, 19))
+    # The cached copy is served (and flagged for a background refresh)
+    assert fetch_csv.calls == 1
+    assert stale
+    assert (master_debt["settlement date"] == "2026-10-20").all()
+    assert (master_debt["Accrued Interest"] > first["Accrued Interest"]).loc[first[" IP RATE"] != 0].all()
+    # The roll is persisted with the original download date
+    _, source_date, settlement_date = read_cache(path)
+    assert (source_date, settlement_date) == ("2026-10-18", "2026-10-20")
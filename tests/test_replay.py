@@ -0,0 +1,33 @@
+import json
+import os
+from datetime import datetime
+import brotli
+import pandas as pd
+from refdata import DEBT_URL
+from replay import Record, replay
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "DEBT.csv")
+GSEC_URL = "https://www.nseindia.com/api/liveBonds-traded-on-cm?type=gsec"
+
+
+def live_body(price, volume):
+    entry = {"symbol": "718GS2033", "series": "GS", "isinCode": "IN0020230010", "totalTradedVolume": volume,
+             "averagePrice": price}
+    for level in range(1, 6):
+        entry.update({f"buyPrice{level}": price - 0.05 * level, f"buyQuantity{level}": 10,
+                      f"sellPrice{level}": price + 0.05 * level, f"sellQuantity{level}": 5})
+    return brotli.compress(json.dumps({"data": [entry]}).encode())
+
+
+def test_replay_across_midnight_keeps_its_cache_until_the_end():
+    with open(FIXTURE, 'rb') as f:
+        master = f.read()
+    before = datetime(2026, 10, 19, 23, 59, 50).timestamp()
+    after = datetime(2026, 10, 20, 0, 0, 10).timestamp()
+    records = [Record(before - 1, DEBT_URL, master), Record(before, GSEC_URL, live_body(101.0, 100)),
+               Record(after, GSEC_URL, live_body(101.2, 0))]
+    service = replay(records, holdings=pd.Series(dtype=float, name="Face"), render=False)
+    # The rollover refetched DEBT.csv into the cache, which is gone afterwards
+    assert service.master_downloads == 2
+    assert service.settlement_date == "2026-10-21"
+    assert not os.path.exists(os.path.dirname(service.master_cache))
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+from risk import load_holdings, position_risk
+
+
+def test_position_risk_uses_best_bid_and_counts_holdings_without_one():
+    data = pd.DataFrame({
+        "Symbol": ["718GS2033", "718GS2033", "718GS2033", "726GS2032", "763SG2031"],
+        "bidquantity": [0, 5, 2, 0, 3],
+        "bidprice": [0.0, 100.5, 101.0, 0.0, 99.0],
+        "bidmacaulay": [np.nan, 5.2, 5.1, np.nan, 4.0],
+        "bidduration": [np.nan, 5.0, 4.9, np.nan, 3.8],
+        "bidconvexity": [np.nan, 31.0, 30.0, np.nan, 20.0],
+        "bidpv01": [np.nan, 0.05, 0.049, np.nan, 0.038],
+    })
+    holdings = pd.Series({"718GS2033": 1_000_000, "726GS2032": 2_000_000, "763SG2031": 1_000_000, "710GS2034": 500_000}, name="Face")
+    positions = position_risk(data, holdings)
+
+    # The highest bid with quantity, not the first depth row
+    assert positions.at["718GS2033", "Market Value"] == 1_010_000
+    assert positions.at["718GS2033", "Duration"] == 4.9
+    assert positions["No bid"].to_dict() == {"718GS2033": 0, "726GS2032": 1, "763SG2031": 0, "710GS2034": 1, "Total": 2}
+    assert positions.loc[["726GS2032", "710GS2034"], "Market Value"].isna().all()
+    # Totals cover the bid holdings only
+    total = positions.loc["Total"]
+    assert total["Face"] == 2_000_000
+    assert total["Market Value"] == 1_010_000 + 990_000
+    assert total["Duration"] == pytest.approx((4.9 * 1_010_000 + 3.8 * 990_000) / 2_000_000)
+
+
+def test_holdings_without_face_values_have_bond_risk_but_no_totals(tmp_path):
+    path = tmp_path / "holdings.csv"
+    path.write_text("Symbol,Face\n718GS2033,\n763SG2031,\n")
+    holdings = load_holdings(str(path))
+    assert holdings.isna().all()
+    data = pd.DataFrame({"Symbol": ["718GS2033", "763SG2031"], "bidquantity": [5, 3], "bidprice": [100.5, 99.0],
+                         "bidmacaulay": [5.2, 4.0], "bidduration": [5.0, 3.8], "bidconvexity": [31.0, 20.0],
+                         "bidpv01": [0.05, 0.038]})
+    positions = position_risk(data, holdings)
+    assert positions.at["718GS2033", "Duration"] == 5.0
+    assert positions.loc["Total", ["Face", "Market Value", "PV01", "Duration"]].isna().all()
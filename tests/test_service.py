@@ -0,0 +1,59 @@
+import os
+from datetime import datetime, timedelta
+from alerts import AlertEngine
+from refdata import DEBT_URL, read_cache
+from service import IngestionService
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "DEBT.csv")
+
+
+class DebtOnlyFetcher:
+    # Serves the DEBT.csv fixture; the live feed never answers
+    def __init__(self):
+        self.gets = []
+
+    def get(self, url):
+        self.gets.append(url)
+        with open(FIXTURE, 'rb') as f:
+            return f.read()
+
+    def poll(self, urls):
+        return {}
+
+
+def test_day_rollover_refetches_master_and_persists_roll(tmp_path):
+    now = [datetime(2026, 10, 19, 10, 0)]
+    fetcher = DebtOnlyFetcher()
+    path = str(tmp_path / "master_debt.arrow")
+    service = IngestionService(fetcher, [], master_cache=path, clock=lambda: now[0], metrics_path=None,
+                               alerts=AlertEngine([], log_path=None))
+    assert fetcher.gets == [DEBT_URL]
+    assert service.fetch_update() is None
+    assert fetcher.gets == [DEBT_URL]
+
+    now[0] += timedelta(days=1)
+    service.fetch_update()
+    service.refresh_thread.join(5)
+    assert fetcher.gets == [DEBT_URL, DEBT_URL]
+    assert service.settlement_date == "2026-10-21"
+    assert (service.master_debt["settlement date"] == "2026-10-21").all()
+    _, source_date, settlement_date = read_cache(path)
+    assert (source_date, settlement_date) == ("2026-10-20", "2026-10-21")
+
+
+def test_recording_fetches_master_even_with_a_warm_cache(tmp_path):
+    now = datetime(2026, 10, 19, 10, 0)
+    path = str(tmp_path / "master_debt.arrow")
+    IngestionService(DebtOnlyFetcher(), [], master_cache=path, clock=lambda: now, metrics_path=None,
+                     alerts=AlertEngine([], log_path=None))
+
+    fetcher = DebtOnlyFetcher()
+    IngestionService(fetcher, [], master_cache=path, clock=lambda: now, metrics_path=None,
+                     alerts=AlertEngine([], log_path=None))
+    assert fetcher.gets == []
+
+    fetcher.recorder = object()
+    service = IngestionService(fetcher, [], master_cache=path, clock=lambda: now, metrics_path=None,
+                               alerts=AlertEngine([], log_path=None))
+    assert fetcher.gets == [DEBT_URL]
+    assert service.refresh_thread is None
@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import numpy as np
+import pandas as pd
+from alerts import Alert
+from curves import NelsonSiegelSvensson, robust_fit
+from worker import SharedSnapshotBus, SnapshotChannel
+
+TENORS = np.array([0.5, 1, 2, 3, 5, 7, 10, 12, 15, 20, 25, 30, 35, 40])
+
+
+def frame(version):
+    return pd.DataFrame({"Symbol": ["718GS2033", "726GS2032", "763SG2031"], "Series": ["GS", "GS", "SG"],
+                         "bidyield": np.array([7.1, 7.2, 7.3]) + version, "bidquantity": [10, 0, 5]})
+
+
+def curves():
+    return {("GS", "bid", "nss"): robust_fit(NelsonSiegelSvensson, TENORS, 6.5 + 0.03 * TENORS)}
+
+
+def alerts(version):
+    return (Alert(1000.0 + version, "Volume spike", "718GS2033", "volume_delta 500"),)
+
+
+def publish(channel, versions):
+    # Worker side: a bus of its own on the shared channel
+    bus = SharedSnapshotBus(channel)
+    for version in versions:
+        bus.publish(frame(version), {"718GS2033"}, curves(), alerts(version))
+
+
+def run(context, channel, versions):
+    process = context.Process(target=publish, args=(channel, versions))
+    process.start()
+    process.join(60)
+    assert process.exitcode == 0
+
+
+def mapped_file(address):
+    # The file backing the mapping that contains address, from /proc/self/maps
+    with open("/proc/self/maps") as f:
+        for line in f:
+            fields = line.split()
+            low, high = (int(bound, 16) for bound in fields[0].split("-"))
+            if low <= address < high:
+                return fields[5] if len(fields) > 5 else None
+
+
+def test_snapshots_round_trip_across_processes(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    channel = SnapshotChannel(context, directory=str(tmp_path), prefix="test")
+    bus = SharedSnapshotBus(channel)
+
+    run(context, channel, [1])
+    snapshot = bus.wait_for(0, timeout=60)
+    assert snapshot.version == 1
+    pd.testing.assert_frame_equal(snapshot.data, frame(1), check_dtype=False)
+    assert snapshot.changed == {"718GS2033"}
+    assert snapshot.alerts == alerts(1)
+    fitted = snapshot.curves[("GS", "bid", "nss")]
+    assert np.allclose(fitted(TENORS), curves()[("GS", "bid", "nss")](TENORS))
+    # Numeric columns are read in place from the mapped file
+    bidyield = snapshot.data["bidyield"].to_numpy()
+    if os.path.exists("/proc/self/maps"):
+        assert mapped_file(bidyield.__array_interface__['data'][0]) == channel.path(1)
+    # Read once per version
+    assert bus.latest() is snapshot
+
+    # Overtaken: three more publishes before the reader looks again; only
+    # the last keep files are left, and the newest is read
+    run(context, channel, [2, 3, 4])
+    assert sorted(os.listdir(tmp_path)) == ["test-3.arrow", "test-4.arrow"]
+    latest = bus.wait_for(1, timeout=5)
+    assert latest.version == 4
+    assert latest.alerts == alerts(4)
+    assert np.allclose(latest.data["bidyield"], [11.1, 11.2, 11.3])
+    # The unlinked first file stays readable through the old mapping
+    assert np.allclose(bidyield, [8.1, 8.2, 8.3])
+
+
+def test_latest_keeps_its_snapshot_when_the_file_is_gone(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    channel = SnapshotChannel(context, directory=str(tmp_path), prefix="test")
+    bus = SharedSnapshotBus(channel)
+    run(context, channel, [1])
+    snapshot = bus.latest()
+    assert snapshot.version == 1
+
+    # A version whose file was removed (e.g. by close()) is skipped
+    channel.remove_files()
+    channel.version.value = 2
+    assert bus.latest() is snapshot
+    assert bus.wait_for(1, timeout=1) is snapshot
+
+    # Overtaken while loading: the file of the version read first is gone by
+    # the time it is opened, so the newest version is read instead
+    load = bus._load
+
+    def overtaken(version):
+        if version == 2:
+            run(context, channel, [3, 4])
+        return load(version)
+
+    bus._load = overtaken
+    assert bus.latest().version == 4
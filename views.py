@@ -0,0 +1,115 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from curves import CURVE_COLUMNS
+from risk import RISK_COLUMNS, position_risk
+
+# Page views
+#
+# Each table page is filtered once per snapshot version and the result is
+# shared by every session. Number formats go to the table as column formats
+# rather than through a Styler, which Streamlit would recompute cell by cell
+# for every session on every render. Market pages show
+# modified duration and PV01 at the bid; the Selling page shows all bid side
+# risk measures of the holdings and their position-weighted totals.
+TABLE_PAGES = ["GS", "SG", "TB", "Selling"]
+MARKET_RISK_COLUMNS = ['bidduration', 'bidpv01']
+SELLING_RISK_COLUMNS = ['bidmacaulay', 'bidduration', 'bidconvexity', 'bidpv01']
+
+
+PERCENTAGE = "%.2f%%"
+ROUND = "%.2f"
+FORMATS = {'bidyield': PERCENTAGE, 'askyield': PERCENTAGE, 'avgyield': PERCENTAGE,
+           'bidprice': ROUND, 'askprice': ROUND, 'VWATP': ROUND,
+           'bidfit': PERCENTAGE, 'askfit': PERCENTAGE, 'avgfit': PERCENTAGE,
+           'bidspread': ROUND, 'askspread': ROUND, 'avgspread': ROUND,
+           **{column: ROUND for column in RISK_COLUMNS}}
+
+
+def snapshot_masks(data, holdings):
+    # Row masks shared by all pages of one snapshot. Series matching runs on
+    # the handful of distinct series, not on every row.
+    series = data["Series"].astype("category")
+    categories = series.cat.categories.astype(str)
+    codes = series.cat.codes.to_numpy()
+
+    def series_mask(name):
+        return np.asarray(categories.str.contains(name), dtype=bool)[codes] & (codes >= 0)
+
+    has_bid = (data["bidquantity"] != 0).to_numpy()
+    return {
+        "quoted": has_bid | (data["askquantity"] != 0).to_numpy(),
+        "has bid": has_bid,
+        "coupon": (data["next coupon date"] != "DNE").to_numpy(),
+        "GS": series_mask("GS"),
+        "SG": series_mask("SG"),
+        "TB": series_mask("TB"),
+        "held": data["Symbol"].isin(holdings.index).to_numpy(),
+    }
+
+
+def page_frame(page, data, masks):
+    market_risk = [column for column in RISK_COLUMNS if column not in MARKET_RISK_COLUMNS]
+    if page == "GS":
+        rows = masks["quoted"] & masks["GS"] & masks["coupon"]
+        dropped = ['nper'] + market_risk
+    elif page == "SG":
+        rows = masks["quoted"] & masks["SG"]
+        dropped = ['nper'] + market_risk
+    elif page == "TB":
+        rows = masks["quoted"] & masks["TB"]
+        # T-bills are not on any fitted curve
+        dropped = ['nper', 'next coupon date'] + CURVE_COLUMNS + market_risk
+    elif page == "Selling":
+        rows = masks["has bid"] & masks["held"]
+        dropped = ['nper'] + [column for column in RISK_COLUMNS if column not in SELLING_RISK_COLUMNS]
+    else:
+        raise ValueError(f"Unknown page: {page}")
+    return data.loc[rows].drop(columns=dropped)
+
+
+class View:
+    # A filtered page for one snapshot version, shared read-only by all
+    # sessions. formats maps each formatted column of frame to its printf
+    # format; summary is the position risk table of the Selling page, else None.
+    def __init__(self, frame, summary=None):
+        self.frame = frame
+        self.formats = {column: fmt for column, fmt in FORMATS.items() if column in frame.columns}
+        self.summary = summary
+
+
+class ViewCache:
+    # Views memoized per (page, version), keeping the most recent entries.
+    # holdings maps symbol to face value held.
+    def __init__(self, holdings, max_entries=2 * len(TABLE_PAGES)):
+        self.holdings = holdings
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.views = OrderedDict()
+        self.masks = (None, None)
+        self.hits = 0
+        self.misses = 0
+
+    def _masks(self, snapshot):
+        version, masks = self.masks
+        if version != snapshot.version:
+            masks = snapshot_masks(snapshot.data, self.holdings)
+            self.masks = (snapshot.version, masks)
+        return masks
+
+    def get(self, page, snapshot):
+        key = (page, snapshot.version)
+        with self.lock:
+            view = self.views.get(key)
+            if view is not None:
+                self.views.move_to_end(key)
+                self.hits += 1
+                return view
+            self.misses += 1
+            frame = page_frame(page, snapshot.data, self._masks(snapshot))
+            summary = position_risk(snapshot.data, self.holdings) if page == "Selling" else None
+            view = View(frame, summary)
+            self.views[key] = view
+            while len(self.views) > self.max_entries:
+                self.views.popitem(last=False)
+            return view
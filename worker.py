@@ -0,0 +1,203 @@
+import atexit
+import glob
+import json
+import multiprocessing
+import os
+import pickle
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+import pyarrow as pa
+from feed import Fetcher
+from metrics import METRICS_PATH, Metrics
+from pipeline import IncrementalPricer
+from replay import Recorder
+from service import IngestionService, Snapshot
+
+# Worker mode
+#
+# With DEBTVIEW_WORKER set, fetching, pricing, risk and curve fitting run in
+# a separate (spawned) process so they never hold the GIL of the Streamlit
+# process. Each snapshot is written once as an uncompressed Arrow IPC file on
+# shared memory (/dev/shm) and announced by bumping a version counter under
+# a cross-process condition. The UI memory-maps the newest file: numeric
+# columns are used in place, only string columns are materialised. With
+# DEBTVIEW_SHARDS > 1 the worker also prices symbol shards on a process pool.
+WORKER_MODE = os.environ.get("DEBTVIEW_WORKER", "") not in ("", "0")
+SHARDS = int(os.environ.get("DEBTVIEW_SHARDS", "0"))
+SHM_DIR = os.environ.get("DEBTVIEW_SHM_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+
+
+class SnapshotChannel:
+    # What the UI and the worker share: where snapshot files live and the
+    # version counter with its condition. Handed to the worker at spawn.
+    def __init__(self, context, directory=SHM_DIR, prefix=None):
+        self.directory = directory
+        self.prefix = prefix or f"debtview-{os.getpid()}"
+        self.condition = context.Condition()
+        self.version = context.Value('Q', 0, lock=False)
+
+    def path(self, version):
+        return os.path.join(self.directory, f"{self.prefix}-{version}.arrow")
+
+    def remove_files(self):
+        for path in glob.glob(os.path.join(self.directory, f"{self.prefix}-*.arrow*")):
+            os.remove(path)
+
+
+class SharedSnapshotBus:
+    # SnapshotBus across processes. The worker publishes, the UI reads;
+    # latest() maps a file once per version. The last keep files are left
+    # in place for readers that are still opening them; a reader that
+    # already mapped a file keeps it after it is unlinked.
+    def __init__(self, channel, keep=2):
+        self.channel = channel
+        self.keep = keep
+        self.lock = threading.Lock()
+        self.snapshot = Snapshot(0, pd.DataFrame(), frozenset(), 0.0)
+
+    def publish(self, data, changed=frozenset(), curves=None, alerts=()):
+        version = self.channel.version.value + 1
+        published_at = time.time()
+        table = pa.Table.from_pandas(data, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b"changed"] = json.dumps(sorted(changed)).encode()
+        metadata[b"curves"] = pickle.dumps(dict(curves or {}))
+        metadata[b"alerts"] = pickle.dumps(tuple(alerts))
+        metadata[b"published_at"] = repr(published_at).encode()
+        table = table.replace_schema_metadata(metadata)
+
+        # Written under a temporary name so readers never map half a file
+        path = self.channel.path(version)
+        with pa.OSFile(f"{path}.tmp", 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(f"{path}.tmp", path)
+        with self.channel.condition:
+            self.channel.version.value = version
+            self.channel.condition.notify_all()
+        try:
+            os.remove(self.channel.path(version - self.keep))
+        except FileNotFoundError:
+            pass
+        with self.lock:
+            self.snapshot = Snapshot(version, data, frozenset(changed), published_at, dict(curves or {}), tuple(alerts))
+            return self.snapshot
+
+    def _load(self, version):
+        table = pa.ipc.open_file(pa.memory_map(self.channel.path(version))).read_all()
+        metadata = table.schema.metadata
+        # split_blocks keeps each numeric column a view of the mapping
+        return Snapshot(version, table.to_pandas(split_blocks=True), frozenset(json.loads(metadata[b"changed"])),
+                        float(metadata[b"published_at"]), pickle.loads(metadata[b"curves"]), pickle.loads(metadata[b"alerts"]))
+
+    def latest(self):
+        with self.lock:
+            while True:
+                version = self.channel.version.value
+                if version == self.snapshot.version:
+                    return self.snapshot
+                try:
+                    self.snapshot = self._load(version)
+                    return self.snapshot
+                except FileNotFoundError:
+                    # Overtaken by newer publishes: retry with the newest,
+                    # or keep what we have if the file is simply gone
+                    if self.channel.version.value == version:
+                        return self.snapshot
+
+    def wait_for(self, version, timeout=None):
+        with self.channel.condition:
+            self.channel.condition.wait_for(lambda: self.channel.version.value > version, timeout)
+        return self.latest()
+
+
+def run_worker(base_url, headers, live_urls, channel, shards=0, record_dir=None, interval=5, metrics_path=METRICS_PATH):
+    # Entry point of the worker process
+    fetcher = Fetcher(base_url, headers, recorder=Recorder(record_dir) if record_dir else None)
+    executor = ProcessPoolExecutor(shards, mp_context=multiprocessing.get_context('spawn')) if shards > 1 else None
+    service = IngestionService(fetcher, live_urls, interval=interval, metrics_path=metrics_path,
+                               bus=SharedSnapshotBus(channel), pricer=IncrementalPricer(executor, shards))
+    service.run()
+
+
+class WorkerIngestion:
+    # Stands in for IngestionService in the UI process. The worker does the
+    # ingestion; this side reads its snapshots, restarts it if it dies,
+    # appends new snapshots to history and merges the worker's metrics file
+    # with the UI's own render metrics in diagnostics().
+    def __init__(self, base_url, headers, live_urls, interval=5, shards=SHARDS, history=None, record_dir=None,
+                 metrics_path=METRICS_PATH):
+        self.context = multiprocessing.get_context('spawn')
+        self.channel = SnapshotChannel(self.context)
+        self.bus = SharedSnapshotBus(self.channel)
+        self.history = history
+        self.metrics = Metrics()
+        self.metrics_path = metrics_path
+        self.stale_after = 3 * interval
+        self.args = (base_url, headers, live_urls, self.channel, shards, record_dir, interval, metrics_path)
+        self.process = None
+        self.thread = None
+
+    def _spawn(self):
+        self.process = self.context.Process(target=run_worker, args=self.args, daemon=True, name='ingestion-worker')
+        self.process.start()
+
+    def run(self):
+        version = self.bus.latest().version
+        while True:
+            if not self.process.is_alive():
+                print(f"Ingestion worker exited with {self.process.exitcode}, restarting")
+                self.metrics.count('worker restarts')
+                self._spawn()
+            snapshot = self.bus.wait_for(version, timeout=1)
+            if snapshot.version == version:
+                continue
+            version = snapshot.version
+            if self.history is not None:
+                try:
+                    with self.metrics.stage('history'):
+                        self.history.append(snapshot.data, snapshot.changed, snapshot.published_at)
+                except Exception as e:
+                    print(f"History append failed: {e}")
+
+    def start(self):
+        if self.thread is None:
+            self._spawn()
+            atexit.register(self.close)
+            self.thread = threading.Thread(target=self.run, daemon=True, name='worker-monitor')
+            self.thread.start()
+        return self
+
+    def close(self):
+        if self.process is not None and self.process.is_alive():
+            self.process.terminate()
+            self.process.join(5)
+        self.channel.remove_files()
+
+    def diagnostics(self, now=None):
+        now = time.time() if now is None else now
+        try:
+            with open(self.metrics_path) as f:
+                report = json.load(f)
+        except (OSError, ValueError):
+            report = {'time': now, 'data_age_seconds': None, 'stages': {}, 'counters': {}, 'gauges': {}, 'http': {}, 'recent': []}
+        # The worker's ages were measured when it wrote the file
+        data_age = report['data_age_seconds']
+        if data_age is not None:
+            data_age += now - report['time']
+        snapshot = self.bus.latest()
+        local = self.metrics.summary()
+        return {
+            **report,
+            'time': now,
+            'snapshot_version': snapshot.version,
+            'snapshot_age_seconds': now - snapshot.published_at if snapshot.version else None,
+            'data_age_seconds': data_age,
+            'stale': data_age is None or data_age > self.stale_after,
+            'stages': {**report['stages'], **local['stages']},
+            'counters': {**report['counters'], **local['counters']},
+            'gauges': {**report['gauges'], **local['gauges'], 'worker alive': int(self.process is not None and self.process.is_alive())},
+            'recent': sorted(report.get('recent', []) + local['recent']),
+        }